@@ -2,15 +2,21 @@ import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import filedialog, messagebox
 import os
+import re
 import shutil
 import subprocess
 from datetime import datetime
 import zipfile
 import json
+import struct
 import concurrent.futures
+import multiprocessing
 import sys
 import threading
 import time
+import queue
+
+from Translation import TranslationCancelled, load_translation_dict, write_translated_profile
 
 if getattr(sys, 'frozen', False):
     # Running as a PyInstaller bundle
@@ -40,10 +46,124 @@ package_name = config["package_name"]
 capture_process = None
 local_folder = None
 
+# Large profiles are translated in a process pool, see Translation.translate_unique_strings,
+# "translation_workers" in config.json sets the pool size (1 translates in-process)
+translation_workers = config.get("translation_workers")
+
+# Extracted symbols shared by all working folders: members/<crc>_<size>_<date>/<abi>/<library>
+# per zip member, build-id/<GNU build-id> per library so identical libraries of different builds are stored once
+symbol_store_dir = config.get("symbol_store_dir") or os.path.join(RUNTIME_DIR, "SymbolStore")
+symbol_store_lock = threading.Lock()
+
+# How gecko-profile-translated.json is written: "stream" rewrites only the stringTable
+# arrays without loading the whole profile, "compact" loads it and writes it without
+# indentation, "indent" is the old indented output. gzip adds a .gz suffix.
+translated_output = config.get("translated_output", "stream")
+gzip_translated_output = config.get("gzip_translated_output", False)
+
 # Add frequency selection variable and default
 frequency_var = None
 # trace_offcpu_var = None
 
+class JobCancelled(Exception):
+    pass
+
+class StageCancelled(JobCancelled):
+    pass
+
+class Job:
+    """
+    A task run by the JobScheduler.
+
+    func(job) runs on a worker thread: it reports progress with job.progress() and
+    stops early when job.check_cancelled() raises. state goes from queued to running
+    and ends as done, failed or cancelled.
+    """
+    def __init__(self, name, func, on_done=None):
+        self.name = name
+        self.func = func
+        self.on_done = on_done
+        self.state = "queued"
+        self.result = None
+        self.cancel_event = threading.Event()
+        self.started = None
+        self.future = None
+        self.status = None
+
+    @property
+    def active(self):
+        return self.state in ("queued", "running")
+
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started is not None else 0.0
+
+    def progress(self, message, color=None):
+        log_message(f"[{self.name}] {message}", color=color)
+
+    def set_status(self, status, color=None):
+        """Sets the step shown next to the job, and logs the change."""
+        if status != self.status:
+            self.status = status
+            self.progress(status, color=color)
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.state = "cancelled"
+            log_message(f"[{self.name}] cancelled before it started", color="yellow")
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+class JobScheduler:
+    """Runs Jobs on a pool of worker threads so that slow file and device work never blocks Tk."""
+    def __init__(self, max_workers=4):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.jobs = []
+        self.lock = threading.Lock()
+
+    def submit(self, name, func, on_done=None):
+        """
+        Queues func(job). on_done(job) is called on the Tk loop once the job has ended,
+        for widget updates. Returns the Job.
+        """
+        job = Job(name, func, on_done)
+        with self.lock:
+            self.jobs = [j for j in self.jobs if j.active] + [job]
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            job.state = "cancelled"
+            return
+        job.state = "running"
+        job.started = time.monotonic()
+        job.progress("started", color="cyan")
+        try:
+            job.result = job.func(job)
+            job.state = "done"
+            job.progress(f"done in {job.elapsed():.1f}s", color="green")
+        except JobCancelled:
+            job.state = "cancelled"
+            job.progress(f"cancelled after {job.elapsed():.1f}s", color="yellow")
+        except Exception as e:
+            job.state = "failed"
+            job.progress(f"failed after {job.elapsed():.1f}s: {e}", color="red")
+        if job.on_done is not None:
+            call_in_ui(job.on_done, job)
+
+    def active_jobs(self, name=None):
+        with self.lock:
+            return [j for j in self.jobs if j.active and (name is None or j.name == name)]
+
+    def cancel_all(self):
+        for job in self.active_jobs():
+            job.cancel()
+
+scheduler = JobScheduler()
+
 def make_apk_debuggable(apk_path):
     # log_message(f"Making {apk_path} debuggable...", color="cyan")
     # print(f"Making {apk_path} debuggable...")
@@ -81,78 +201,320 @@ def make_apk_debuggable(apk_path):
     #     log_message(f"Error running command: {e}", color="red")
     return True
 
+# app_profiler.py output that moves a capture to its next step, most advanced step first
+CAPTURE_STEP_PATTERNS = [
+    ("syncing binary cache", re.compile(r"binary.?cache", re.IGNORECASE)),
+    ("pulling perf.data", re.compile(r"\bpull\b.*perf\.data|perf\.data.*\bpull", re.IGNORECASE)),
+    ("recording", re.compile(r"simpleperf.*\brecord\b|start.*profil|waiting for", re.IGNORECASE)),
+]
+CAPTURE_STEPS = ["starting"] + [step for step, _ in reversed(CAPTURE_STEP_PATTERNS)]
+
+def capture_step(line, current):
+    """Step reached by an app_profiler.py output line, steps only move forward."""
+    for step, pattern in CAPTURE_STEP_PATTERNS:
+        if CAPTURE_STEPS.index(step) <= CAPTURE_STEPS.index(current):
+            break
+        if pattern.search(line):
+            return step
+    return current
+
 def start_capture():
-    global capture_process
-    global local_folder
     if local_folder is None:
         log_message("Please fetch an APK first to create a working folder.", color="red")
         return False
-    try:
-        duration = duration_entry.get()
-        if not duration.isdigit() or int(duration) <= 0:
-            log_message("Please enter a valid positive number for duration.", color="red")
-            return False
-        
-        duration = int(duration)
-        frequency = frequency_var.get()
-
-        # Command to start simpleperf
-        # trace_offcpu = trace_offcpu_var.get()
-        # trace_flag = "--trace-offcpu" if trace_offcpu else ""
-        record_args = f"-e cpu-clock -f {frequency} --duration {duration} -g".strip()
-        cmd = [
-            "python",
-            app_profiler_script,
-            "-p", package_name,
-            "-r", record_args
-        ]
-        # Start the process, capturing output (optional) and allowing termination
-        capture_process = subprocess.Popen(cmd, creationflags=subprocess.CREATE_NEW_CONSOLE, cwd=local_folder)
-        log_message(f"Capture started! Running for {duration} seconds at {frequency} Hz...", color="green")
-        
-        # Start countdown in a separate thread
-        def countdown_progress():
-            for i in range(duration + 5, 0, -1):
-                percent = 100 - int((i / (duration + 5)) * 100)
-                log_message(f"Simpleperf Profiling Progress {percent}%")
-                time.sleep(1)
-            log_message("Simpleperf Profiling Capture Complete")
-        threading.Thread(target=countdown_progress, daemon=True).start()
-        return True
-    except Exception as e:
-        log_message(f"Failed to start capture: {e}", color="red")
+    if scheduler.active_jobs("capture"):
+        log_message("A capture is already running.", color="yellow")
+        return False
+    duration = duration_entry.get()
+    if not duration.isdigit() or int(duration) <= 0:
+        log_message("Please enter a valid positive number for duration.", color="red")
         return False
+    
+    duration = int(duration)
+    frequency = frequency_var.get()
+    folder = local_folder
+    scheduler.submit("capture", lambda job: capture_job(folder, duration, frequency, job), on_done=on_capture_done)
+    return True
+
+def capture_job(folder, duration, frequency, job):
+    """Runs app_profiler.py, streaming its output into the console and following its steps."""
+    global capture_process
+    # Command to start simpleperf
+    # trace_offcpu = trace_offcpu_var.get()
+    # trace_flag = "--trace-offcpu" if trace_offcpu else ""
+    record_args = f"-e cpu-clock -f {frequency} --duration {duration} -g".strip()
+    cmd = [
+        "python",
+        app_profiler_script,
+        "-p", package_name,
+        "-r", record_args
+    ]
+    perf_data_path = os.path.join(folder, "perf.data")
+    previous_mtime = os.path.getmtime(perf_data_path) if os.path.exists(perf_data_path) else None
+    capture_process = subprocess.Popen(cmd, cwd=folder, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       text=True, errors="replace", env=dict(os.environ, PYTHONUNBUFFERED="1"),
+                                       creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+    job.progress(f"Capture started! Running for {duration} seconds at {frequency} Hz...", color="green")
+    job.set_status("starting")
+
+    # a reader thread hands the output over, so the steps can be followed while the process is quiet
+    lines = queue.Queue()
+    def read_output():
+        for line in capture_process.stdout:
+            lines.put(line.rstrip())
+        lines.put(None)
+    threading.Thread(target=read_output, daemon=True).start()
+
+    recording_started = None
+    next_report = 0
+    while True:
+        try:
+            line = lines.get(timeout=0.5)
+        except queue.Empty:
+            line = ""
+        if line is None:
+            break
+        if job.cancel_event.is_set():
+            capture_process.terminate()
+            capture_process.wait()
+            raise JobCancelled(job.name)
+        if line:
+            log_message(f"  {line}")
+            job.set_status(capture_step(line, job.status), color="cyan")
+        if job.status == "recording":
+            if recording_started is None:
+                recording_started = time.monotonic()
+            recorded = time.monotonic() - recording_started
+            if recorded >= next_report:
+                job.progress(f"Recording {min(recorded, duration):.0f}/{duration}s")
+                next_report += 5
+
+    returncode = capture_process.wait()
+    if returncode != 0:
+        job.set_status("failed", color="red")
+        raise RuntimeError(f"app_profiler.py exited with code {returncode}")
+    if not os.path.exists(perf_data_path) or os.path.getmtime(perf_data_path) == previous_mtime:
+        job.set_status("failed", color="red")
+        raise RuntimeError("app_profiler.py finished without a new perf.data")
+    job.set_status("done", color="green")
+    return folder
+
+def on_capture_done(job):
+    if job.state == "done" and auto_post_process_var.get():
+        post_process_data(job.result)
+
+def copy_with_progress(src, dst, job, chunk_size=8 << 20):
+    total = os.path.getsize(src)
+    copied = 0
+    next_report = 0.25
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        while True:
+            job.check_cancelled()
+            chunk = fsrc.read(chunk_size)
+            if not chunk:
+                break
+            fdst.write(chunk)
+            copied += len(chunk)
+            if total and copied / total >= next_report:
+                job.progress(f"copied {copied * 100 // total}% of {os.path.basename(src)}")
+                next_report += 0.25
+    shutil.copystat(src, dst)
+
+def gnu_build_id(path):
+    """GNU build-id of an ELF file as a hex string, None if it has none."""
+    try:
+        with open(path, "rb") as f:
+            ident = f.read(16)
+            if len(ident) < 16 or ident[:4] != b"\x7fELF":
+                return None
+            is_64 = ident[4] == 2
+            endian = "<" if ident[5] == 1 else ">"
+            if is_64:
+                f.seek(0x28)
+                shoff, = struct.unpack(endian + "Q", f.read(8))
+                f.seek(0x3A)
+            else:
+                f.seek(0x20)
+                shoff, = struct.unpack(endian + "I", f.read(4))
+                f.seek(0x2E)
+            shentsize, shnum = struct.unpack(endian + "HH", f.read(4))
+            for i in range(shnum):
+                f.seek(shoff + i * shentsize)
+                header = f.read(shentsize)
+                sh_type, = struct.unpack(endian + "I", header[4:8])
+                if sh_type != 7:  # SHT_NOTE
+                    continue
+                if is_64:
+                    offset, size = struct.unpack(endian + "QQ", header[24:40])
+                else:
+                    offset, size = struct.unpack(endian + "II", header[16:24])
+                f.seek(offset)
+                notes = f.read(size)
+                pos = 0
+                while pos + 12 <= len(notes):
+                    namesz, descsz, note_type = struct.unpack(endian + "III", notes[pos:pos + 12])
+                    name_start = pos + 12
+                    desc_start = name_start + (namesz + 3) // 4 * 4
+                    if note_type == 3 and notes[name_start:name_start + namesz].rstrip(b"\0") == b"GNU":  # NT_GNU_BUILD_ID
+                        return notes[desc_start:desc_start + descsz].hex()
+                    pos = desc_start + (descsz + 3) // 4 * 4
+    except (OSError, struct.error):
+        return None
+    return None
+
+def link_or_copy(src, dst):
+    """Hardlinks src to dst, falling back to a symlink and then to a copy."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+        return "linked"
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(src), dst)
+        return "symlinked"
+    except OSError:
+        shutil.copy2(src, dst)
+        return "copied"
+
+def share_by_build_id(path):
+    """Replaces an ELF file by a link to the store's copy for its GNU build-id, or makes it that copy."""
+    build_id = gnu_build_id(path)
+    if build_id is None:
+        return
+    shared = os.path.join(symbol_store_dir, "build-id", build_id, os.path.basename(path))
+    with symbol_store_lock:
+        if os.path.exists(shared) and os.path.getsize(shared) == os.path.getsize(path):
+            link_or_copy(shared, path)
+        else:
+            link_or_copy(path, shared)
+
+def find_zip_member(names, abi, lib_name):
+    suffix = f"{abi}/{lib_name}"
+    for name in names:
+        normalized = name.replace("\\", "/")
+        if normalized == suffix or normalized.endswith("/" + suffix):
+            return name
+    return None
+
+# Libraries linked into binary_cache, and the ABIs they are recorded for at fetch time
+SYMBOL_LIBS = ("libil2cpp.so.debug", "libunity.sym.so")
+SYMBOL_ABIS = ("arm64-v8a", "armeabi-v7a")
+
+def member_key(info):
+    """Store key of a zip member, from its CRC-32, size and date in the zip's central directory."""
+    return "{:08x}_{}_{:04d}{:02d}{:02d}{:02d}{:02d}{:02d}".format(info.CRC, info.file_size, *info.date_time)
+
+def member_store_path(key, abi, lib_name):
+    return os.path.join(symbol_store_dir, "members", key, abi, lib_name)
+
+def symbol_source(zip_path):
+    """
+    Describes a symbols.zip for symbol_sources.json: its path and the store key and size
+    of each of its SYMBOL_LIBS per ABI, read from the central directory only.
+    """
+    members = {}
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            names = zip_ref.namelist()
+            for abi in SYMBOL_ABIS:
+                for lib_name in SYMBOL_LIBS:
+                    member = find_zip_member(names, abi, lib_name)
+                    if member is not None:
+                        info = zip_ref.getinfo(member)
+                        members[f"{abi}/{lib_name}"] = {"key": member_key(info), "size": info.file_size}
+    except (OSError, zipfile.BadZipFile) as e:
+        log_message(f"Failed to read {zip_path}: {e}", color="red")
+    return {"zip": zip_path, "members": members}
+
+def stored_symbol(source, abi, lib_name, cancel=None, chunk_size=8 << 20):
+    """
+    Returns the store path of one library of a symbol source, extracting only that
+    member of its symbols.zip the first time it is needed. None if the library is
+    neither stored nor in the zip.
+
+    A library recorded in source at fetch time is found in the store without opening
+    the zip, so it keeps working after the zip is moved or cleaned up.
+    """
+    recorded = source["members"].get(f"{abi}/{lib_name}")
+    if recorded is not None:
+        path = member_store_path(recorded["key"], abi, lib_name)
+        if os.path.exists(path) and os.path.getsize(path) == recorded["size"]:
+            log_message(f"Reusing stored {abi}/{lib_name}", color="cyan")
+            return path
+    zip_path = source["zip"]
+    if not os.path.exists(zip_path):
+        return None
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        member = find_zip_member(zip_ref.namelist(), abi, lib_name)
+        if member is None:
+            return None
+        info = zip_ref.getinfo(member)
+        path = member_store_path(member_key(info), abi, lib_name)
+        if os.path.exists(path) and os.path.getsize(path) == info.file_size:
+            log_message(f"Reusing stored {abi}/{lib_name}", color="cyan")
+            return path
+        # stream the member to a temporary file and rename, a cancelled extraction never looks complete
+        start = time.monotonic()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+        try:
+            with zip_ref.open(member) as src, open(tmp, "wb") as dst:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        raise StageCancelled("extract symbols")
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    share_by_build_id(path)
+    log_message(f"Extracted {member} ({info.file_size >> 20} MB) from {os.path.basename(zip_path)} in {time.monotonic() - start:.1f}s", color="cyan")
+    return path
+
+def load_symbol_sources(folder):
+    """Symbol sources recorded for a working folder by fetch_apk, see symbol_source."""
+    try:
+        with open(os.path.join(folder, "symbol_sources.json"), "r", encoding="utf-8") as f:
+            sources = json.load(f)
+    except (OSError, ValueError):
+        return []
+    # folders fetched before the member keys were recorded only list the zip paths
+    return [{"zip": source, "members": {}} if isinstance(source, str) else source for source in sources]
 
 def fetch_apk():
-    global local_folder
     apk_path = apk_entry.get()
     if not apk_path or not os.path.exists(apk_path):
         messagebox.showerror(f"Error", "Please provide a valid APK path: {apk_path}")
         log_message(f"Error: Please provide a valid APK path: {apk_path}", color="red")
         return
-    
+    scheduler.submit("fetch apk", lambda job: fetch_apk_job(apk_path, job), on_done=on_apk_fetched)
+
+def fetch_apk_job(apk_path, job):
+    """Copies an APK and its symbols into a new working folder, returns the folder."""
     # Define local folder
     timestamp = datetime.now().strftime("%Y%m%d_%H_%M_%S")  # e.g., 20250224_153045
     results_dir = os.path.join(RUNTIME_DIR, "Results")
     os.makedirs(results_dir, exist_ok=True)  # Ensure Results folder exists
-    local_folder = os.path.join(results_dir, f"apks_{timestamp}")
-    os.makedirs(local_folder, exist_ok=True)  # Create folder if it doesn't exist
+    folder = os.path.join(results_dir, f"apks_{timestamp}")
+    os.makedirs(folder, exist_ok=True)  # Create folder if it doesn't exist
     
     # Get the original APK filename and construct local path
     apk_filename = os.path.basename(apk_path)
-    local_apk_path = os.path.join(local_folder, apk_filename)
+    local_apk_path = os.path.join(folder, apk_filename)
     
     # Copy APK to local folder
-    shutil.copy(apk_path, local_apk_path)
+    copy_with_progress(apk_path, local_apk_path, job)
 
     # Check if the APK comes from an "etc" package and pull additional files
     current_folder = os.path.dirname(apk_path)  # e.g., before_shell_etc
     parent_folder = os.path.dirname(current_folder)  # e.g., FFO_OB48_...
-    log_message(f"Use apk from {current_folder}", color="cyan")
-    
-    current_folder = os.path.dirname(apk_path)
-    parent_folder = os.path.dirname(current_folder)
-    symbol_folder = os.path.join(local_folder, "Symbol")
+    job.progress(f"Use apk from {current_folder}", color="cyan")
     
     package_type = None
     if "etc" in apk_filename.lower():
@@ -161,14 +523,15 @@ def fetch_apk():
         package_type = "astc"
     
     if package_type:
-        # Handle symbols.zip
+        # Handle symbols.zip, only the libraries of the captured ABI get extracted during post-processing
+        symbol_sources = []
         for file in os.listdir(parent_folder):
             if "symbols.zip" in file.lower() and package_type in file.lower():
-                src_zip = os.path.join(parent_folder, file)
-                os.makedirs(symbol_folder, exist_ok=True)
-                with zipfile.ZipFile(src_zip, 'r') as zip_ref:
-                    zip_ref.extractall(symbol_folder)
-                log_message(f"Unzipped {file} to {symbol_folder}", color="cyan")
+                symbol_sources.append(symbol_source(os.path.join(parent_folder, file)))
+                job.progress(f"Using symbols from {file}", color="cyan")
+        if symbol_sources:
+            with open(os.path.join(folder, "symbol_sources.json"), "w", encoding="utf-8") as f:
+                json.dump(symbol_sources, f, indent=4)
         
         # Handle nameTranslation.txt
         others_path = os.path.join(parent_folder, f"others_{package_type}")
@@ -176,173 +539,261 @@ def fetch_apk():
             name_translation_file = "nameTranslation.txt"
             src_path = os.path.join(others_path, name_translation_file)
             if os.path.exists(src_path):
-                shutil.copy(src_path, os.path.join(local_folder, name_translation_file))
-                log_message(f"Copied {name_translation_file} to {local_folder}", color="cyan")
+                shutil.copy(src_path, os.path.join(folder, name_translation_file))
+                job.progress(f"Copied {name_translation_file} to {folder}", color="cyan")
     
-    if make_apk_debuggable(local_apk_path):
-        log_message(f"APK fetched to {local_folder} and made debuggable!", color="green")
-        update_folder_dropdown()
-        folder_var.set(f"apks_{timestamp}")
-        log_message(f"Current Working Folder: {local_folder}", color="cyan")
-    else:
-        log_message("Failed to make APK debuggable.", color="red")
+    if not make_apk_debuggable(local_apk_path):
+        raise RuntimeError("Failed to make APK debuggable.")
+    return folder
+
+def on_apk_fetched(job):
+    global local_folder
+    if job.state != "done":
+        return
+    local_folder = job.result
+    log_message(f"APK fetched to {local_folder} and made debuggable!", color="green")
+    update_folder_dropdown()
+    folder_var.set(os.path.basename(local_folder))
+    log_message(f"Current Working Folder: {local_folder}", color="cyan")
 
 def start_button_click():
     start_capture()
 
-def post_process_data():
-    global local_folder
-    if local_folder is None or not os.path.exists(local_folder):
-        log_message("No working folder found. Fetch an APK first.", color="red")
+def run_command(name, cmd, cwd, cancel, stdout=None):
+    """Runs a command to completion, terminating it when cancel is set."""
+    process = subprocess.Popen(cmd, cwd=cwd, stdout=stdout)
+    start = time.monotonic()
+    next_report = 15
+    while True:
+        try:
+            returncode = process.wait(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel.is_set():
+                process.terminate()
+                process.wait()
+                raise StageCancelled(name)
+            elapsed = time.monotonic() - start
+            if elapsed >= next_report:
+                log_message(f"[{name}] still running ({elapsed:.0f}s)")
+                next_report += 15
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+def run_stage(name, cancel, func, *args):
+    """Runs one post-processing stage and logs its elapsed time, a failure cancels the other stages."""
+    if cancel.is_set():
+        raise StageCancelled(name)
+    log_message(f"[{name}] started", color="cyan")
+    start = time.monotonic()
+    try:
+        result = func(*args)
+    except StageCancelled:
+        log_message(f"[{name}] cancelled after {time.monotonic() - start:.1f}s", color="yellow")
+        raise
+    except Exception as e:
+        log_message(f"[{name}] failed after {time.monotonic() - start:.1f}s: {e}", color="red")
+        cancel.set()
+        raise
+    log_message(f"[{name}] done in {time.monotonic() - start:.1f}s", color="green")
+    return result
+
+def prepare_binary_cache(folder, cancel=None):
+    # Step 0: Prepare binary_cache arm64 folder
+    binary_cache_base = os.path.join(folder, "binary_cache", "data", "app")
+    if not os.path.exists(binary_cache_base):
+        log_message("binary_cache/data/app not found.", color="red")
         return False
     
-    perf_data_path = os.path.join(local_folder, "perf.data")
-    if not os.path.exists(perf_data_path):
-        log_message("No perf.data found in the working folder.", color="red")
+    # Only include folders that contain the package_name
+    intermediate_folders = [f for f in os.listdir(binary_cache_base) if os.path.isdir(os.path.join(binary_cache_base, f)) and package_name in f]
+    if not intermediate_folders:
+        log_message(f"No {package_name} folder found in binary_cache/data/app.", color="red")
         return False
     
-    try:
-        # Step 0: Prepare binary_cache arm64 folder
-        binary_cache_base = os.path.join(local_folder, "binary_cache", "data", "app")
-        if not os.path.exists(binary_cache_base):
-            log_message("binary_cache/data/app not found.", color="red")
-            return False
-        
-        # Only include folders that contain the package_name
-        intermediate_folders = [f for f in os.listdir(binary_cache_base) if os.path.isdir(os.path.join(binary_cache_base, f)) and package_name in f]
-        if not intermediate_folders:
-            log_message(f"No {package_name} folder found in binary_cache/data/app.", color="red")
-            return False
-        
-        latest_intermediate = max(intermediate_folders, key=lambda f: os.path.getmtime(os.path.join(binary_cache_base, f)))
-        latest_package_name_path = os.path.join(binary_cache_base, latest_intermediate)
-        lib_path = os.path.join(latest_package_name_path, "lib")
-        
-        # Determine architecture (arm64 or armeabi-v7a)
-        arm64_path = os.path.join(lib_path, "arm64")
-        armeabi_v7a_path = os.path.join(lib_path, "arm")
-        
-        if os.path.exists(arm64_path):
-            target_path = arm64_path
-            symbol_path = os.path.join(local_folder, "Symbol", "arm64-v8a")
-            arch = "arm64-v8a"
-        elif os.path.exists(armeabi_v7a_path):
-            target_path = armeabi_v7a_path
-            symbol_path = os.path.join(local_folder, "Symbol", "armeabi-v7a")
-            arch = "armeabi-v7a"
-        else:
-            log_message(f"No arm64 or arm folder found in {lib_path}.", color="red")
-            return False
+    latest_intermediate = max(intermediate_folders, key=lambda f: os.path.getmtime(os.path.join(binary_cache_base, f)))
+    latest_package_name_path = os.path.join(binary_cache_base, latest_intermediate)
+    lib_path = os.path.join(latest_package_name_path, "lib")
+    
+    # Determine architecture (arm64 or armeabi-v7a)
+    arm64_path = os.path.join(lib_path, "arm64")
+    armeabi_v7a_path = os.path.join(lib_path, "arm")
+    
+    if os.path.exists(arm64_path):
+        target_path = arm64_path
+        symbol_path = os.path.join(folder, "Symbol", "arm64-v8a")
+        arch = "arm64-v8a"
+    elif os.path.exists(armeabi_v7a_path):
+        target_path = armeabi_v7a_path
+        symbol_path = os.path.join(folder, "Symbol", "armeabi-v7a")
+        arch = "armeabi-v7a"
+    else:
+        log_message(f"No arm64 or arm folder found in {lib_path}.", color="red")
+        return False
+    
+    if os.path.exists(target_path):
+        # Delete libil2cpp.so and libunity.so if they exist
+        for lib in ["libil2cpp.so", "libunity.so"]:
+            lib_path = os.path.join(target_path, lib)
+            if os.path.exists(lib_path):
+                os.remove(lib_path)
+                log_message(f"Deleted {lib_path}", color="yellow")
         
-        if os.path.exists(target_path):
-            # Delete libil2cpp.so and libunity.so if they exist
-            for lib in ["libil2cpp.so", "libunity.so"]:
-                lib_path = os.path.join(target_path, lib)
-                if os.path.exists(lib_path):
-                    os.remove(lib_path)
-                    log_message(f"Deleted {lib_path}", color="yellow")
-            
-            if not os.path.exists(symbol_path):
-                log_message(f"{symbol_path} not found.", color="red")
-                return False
-            
-            # Copy libil2cpp.so.debug as libil2cpp.so
-            src_il2cpp = os.path.join(symbol_path, "libil2cpp.so.debug")
-            dst_il2cpp = os.path.join(target_path, "libil2cpp.so")
-            if os.path.exists(src_il2cpp):
-                shutil.copy(src_il2cpp, dst_il2cpp)
-                log_message(f"Copied {src_il2cpp} to {dst_il2cpp}", color="yellow")
-            else:
-                log_message(f"libil2cpp.so.debug not found in Symbol/{arch}.", color="red")
-                return False
-            
-            # Copy libunity.sym.so as libunity.so
-            src_unity = os.path.join(symbol_path, "libunity.sym.so")
-            dst_unity = os.path.join(target_path, "libunity.so")
-            if os.path.exists(src_unity):
-                shutil.copy(src_unity, dst_unity)
-                log_message(f"Copied {src_unity} to {dst_unity}", color="yellow")
-            else:
-                log_message(f"libunity.sym.so not found in Symbol/{arch}.", color="red")
+        # Link libil2cpp.so.debug as libil2cpp.so and libunity.sym.so as libunity.so, from Symbol/
+        # for folders fetched with extracted symbols, else straight from the recorded symbols.zip
+        symbol_sources = load_symbol_sources(folder)
+        for lib_name, target_name in zip(SYMBOL_LIBS, ("libil2cpp.so", "libunity.so")):
+            src = os.path.join(symbol_path, lib_name)
+            if not os.path.exists(src):
+                src = None
+                for source in symbol_sources:
+                    src = stored_symbol(source, arch, lib_name, cancel)
+                    if src is not None:
+                        break
+            if src is None:
+                log_message(f"{lib_name} not found in Symbol/{arch} or the symbols.zip of {folder}.", color="red")
                 return False
+            dst = os.path.join(target_path, target_name)
+            how = link_or_copy(src, dst)
+            log_message(f"{how.capitalize()} {src} to {dst}", color="yellow")
+    return True
+
+def generate_gecko_profile(folder, cancel):
+    gecko_cmd = [
+        "python",
+        gecko_script,
+        "-i", "perf.data",
+        "--symfs", r".\binary_cache",
+    ]
+    with open(os.path.join(folder, "gecko-profile.json"), "wb") as f:
+        run_command("gecko profile", gecko_cmd, folder, cancel, stdout=f)
+
+def translate_gecko_profile(folder, result_folder, cancel):
+    gecko_file_path = os.path.join(folder, "gecko-profile.json")
+    translated_gecko_file_path = os.path.join(result_folder, "gecko-profile-translated.json")
+    if gzip_translated_output:
+        translated_gecko_file_path += ".gz"
+
+    # Load the name translation table
+    translation_dict = load_translation_dict(os.path.join(folder, "nameTranslation.txt"))
+    try:
+        unique_count, errors = write_translated_profile(gecko_file_path, translated_gecko_file_path, translation_dict,
+                                                        output=translated_output, workers=translation_workers,
+                                                        cancel=cancel)
+    except TranslationCancelled:
+        raise StageCancelled("translation")
+    log_message(f"Translated {unique_count} unique strings to {translated_gecko_file_path}", color="cyan")
+    for error in errors:
+        log_message(error, color="red")
+    if errors:
+        raise RuntimeError(f"{len(errors)} translation errors")
+
+    # Delete the untranslated origin
+    os.remove(gecko_file_path)
+
+def generate_report(folder, result_folder, cancel):
+    report_func_cmd = [
+        "python",
+        report_func,
+        "-i", "perf.data",
+        "-o", os.path.join(result_folder, "report.txt"),
+        "-n", "--full-callgraph",
+        "--symfs", r".\binary_cache",
+    ]
+    run_command("report", report_func_cmd, folder, cancel)
+
+def post_process_pipeline(folder, cancel):
+    """
+    Runs the post-processing stages of a working folder, meant for a background thread.
+
+    The gecko profile (then its translation) and report.py only read perf.data and
+    binary_cache, so both branches run at the same time. A failed stage sets cancel
+    to stop the other branch. Returns "done", "cancelled" when every stopped stage
+    was cancelled, or "failed".
+    """
+    start = time.monotonic()
+    try:
+        if not run_stage("binary cache", cancel, prepare_binary_cache, folder, cancel):
+            log_message("Post-processing stopped, binary_cache is not ready.", color="red")
+            return "failed"
 
-        
-        # Step 1: Generate gecko-profile.json
-        gecko_cmd = [
-            "python",
-            gecko_script,
-            "-i", "perf.data",
-            "--symfs", r".\binary_cache",
-            ">", "gecko-profile.json"
-        ]
-        # Use shell=True to handle redirection
-        subprocess.run(" ".join(gecko_cmd), shell=True, cwd=local_folder, check=True)
-        log_message("Generated gecko-profile.json", color="cyan")
-        
         timestamp = datetime.now().strftime("%Y%m%d_%H_%M_%S")
-        result_folder = os.path.join(local_folder, f"result_{timestamp}")
+        result_folder = os.path.join(folder, f"result_{timestamp}")
         os.makedirs(result_folder, exist_ok=True)
-        
-        # Step 2: Translate symbols in gecko-profile.json
-        gecko_file_path = os.path.join(local_folder, "gecko-profile.json")
-        translation_file_path = os.path.join(local_folder, "nameTranslation.txt")
-        translated_gecko_file_path = os.path.join(result_folder, "gecko-profile-translated.json")
-
-        if not os.path.exists(translation_file_path):
-            log_message("nameTranslation.txt not found for translation.", color="red")
-            return False
-
-        # Load the name translation table
-        translation_dict = {}
-        with open(translation_file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                if "⇨" in line:
-                    obfuscated, readable = line.strip().split("⇨")
-                    translation_dict[obfuscated] = readable
-
-        # Function to translate obfuscated names
-        def translate_symbol(symbol):
-            words = symbol.split("_")
-            translated_words = [translation_dict.get(word, word) for word in words]
-            return "_".join(translated_words)
-
-        # Process all threads in parallel with translated symbols
-        def process_thread_with_translation(thread):
-            string_table = thread.get("stringTable", [])
-            updated_strings = [translate_symbol(entry) for entry in string_table]
-            thread["stringTable"] = updated_strings
-
-        with open(gecko_file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                executor.map(process_thread_with_translation, data.get("threads", []))
-
-        # Save the updated JSON and delete origin
-        with open(translated_gecko_file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4)
-        os.remove(gecko_file_path)
-
-        report_func_cmd = [
-            "python",
-            report_func,
-            "-i", "perf.data",
-            "-o", f"{os.path.join(result_folder, 'report.txt')}",
-            "-n --full-callgraph",
-            "--symfs", r".\binary_cache"
-        ]
-        subprocess.run(" ".join(report_func_cmd), shell=True, cwd=local_folder, check=True)
-
-        log_message(f"Data post-processing completed! Check {result_folder}", color="green")
+
+        def gecko_branch():
+            run_stage("gecko profile", cancel, generate_gecko_profile, folder, cancel)
+            run_stage("translation", cancel, translate_gecko_profile, folder, result_folder, cancel)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            branches = [
+                executor.submit(gecko_branch),
+                executor.submit(run_stage, "report", cancel, generate_report, folder, result_folder, cancel),
+            ]
+            errors = [branch.exception() for branch in branches]
+        if any(errors):
+            if not os.listdir(result_folder):
+                os.rmdir(result_folder)
+            if all(error is None or isinstance(error, StageCancelled) for error in errors):
+                log_message(f"Post-processing cancelled after {time.monotonic() - start:.1f}s", color="yellow")
+                return "cancelled"
+            log_message(f"Post-processing failed after {time.monotonic() - start:.1f}s", color="red")
+            return "failed"
+
+        log_message(f"Data post-processing completed in {time.monotonic() - start:.1f}s! Check {result_folder}", color="green")
         # Open the result folder in Windows Explorer
         try:
             os.startfile(result_folder)
         except Exception as e:
             log_message(f"Failed to open result folder: {e}", color="red")
-        return True
+        return "done"
+    except StageCancelled:
+        log_message("Post-processing cancelled", color="yellow")
+        return "cancelled"
     except Exception as e:
         log_message(f"Failed to post-process data: {e}", color="red")
+        return "failed"
+
+def post_process_data(folder=None):
+    """Queues post-processing of a working folder, the current one by default, as a background job."""
+    folder = folder or local_folder
+    if folder is None or not os.path.exists(folder):
+        log_message("No working folder found. Fetch an APK first.", color="red")
+        return False
+    
+    perf_data_path = os.path.join(folder, "perf.data")
+    if not os.path.exists(perf_data_path):
+        log_message("No perf.data found in the working folder.", color="red")
+        return False
+
+    if not os.path.exists(os.path.join(folder, "nameTranslation.txt")):
+        log_message("nameTranslation.txt not found for translation.", color="red")
+        return False
+
+    if scheduler.active_jobs("post-process"):
+        log_message("Post-processing is already running.", color="yellow")
         return False
 
+    scheduler.submit("post-process", lambda job: post_process_job(folder, job))
+    return True
+
+def post_process_job(folder, job):
+    # a failed stage sets the event too, only the pipeline knows whether the user cancelled
+    outcome = post_process_pipeline(folder, job.cancel_event)
+    if outcome == "cancelled":
+        raise JobCancelled(job.name)
+    if outcome != "done":
+        raise RuntimeError("post-processing did not complete")
+
+def cancel_jobs():
+    jobs = scheduler.active_jobs()
+    if not jobs:
+        log_message("No job is running.", color="yellow")
+        return
+    for job in jobs:
+        log_message(f"Cancelling {job.name}...", color="yellow")
+        job.cancel()
+
 def list_local_folders():
     results_dir = os.path.join(RUNTIME_DIR, "Results")
     if not os.path.exists(results_dir):
@@ -370,7 +821,6 @@ def on_folder_select(event=None):
         log_message(f"Selected local folder: {local_folder}", color="cyan")
 
 def install_apk_from_local():
-    global local_folder
     if not local_folder or not os.path.exists(local_folder):
         log_message("No local folder selected.", color="red")
         return
@@ -380,110 +830,180 @@ def install_apk_from_local():
         log_message("No APK file found in the selected local folder.", color="red")
         return
     apk_path = os.path.join(local_folder, apk_files[0])
-    log_message(f"Installing APK: {apk_path}", color="cyan")
-    try:
-        result = subprocess.run(["adb", "install", "-r", apk_path], capture_output=True, text=True)
-        if result.returncode == 0:
-            log_message("APK installed successfully!", color="green")
-        else:
-            log_message(f"Failed to install APK: {result.stderr}", color="red")
-    except Exception as e:
-        log_message(f"Error running adb install: {e}", color="red")
-# Create the main window
-window = tk.Tk()
-frequency_var = tk.StringVar(value="1000")
-# trace_offcpu_var = tk.BooleanVar(value=False)
-window.title("Simpleperf Capture Tool")
-window.geometry("800x600")  # Larger window size
-window.configure(bg="#f0f0f0")  # Light gray background for contrast
-
-# Custom font for better readability
-font_large = ("Arial", 12, "bold")
-font_medium = ("Arial", 10)
-
-step1_label = tk.Label(window, text="Step 1: Either fetch a new APK or reuse a previous local folder.", font=("Arial", 12, "bold"), bg="#f0f0f0", fg="#AA5500")
-step1_label.pack(pady=(20, 5))
-
-# APK path input section (compact)
-apk_path_frame = tk.Frame(window, bg="#f0f0f0")
-apk_path_frame.pack(pady=10)
-tk.Label(apk_path_frame, text="APK Path:", font=font_large, bg="#f0f0f0").pack(side=tk.LEFT, padx=(0, 10))
-apk_entry = tk.Entry(apk_path_frame, width=40, font=font_medium)
-apk_entry.pack(side=tk.LEFT, padx=(0, 10))
-
-def clear_and_browse_apk():
-    apk_entry.delete(0, tk.END)
-    path = filedialog.askopenfilename()
-    if path:
-        apk_entry.insert(0, path)
-
-browse_btn = tk.Button(apk_path_frame, text="Browse", font=font_medium, bg="#d3d3d3", command=clear_and_browse_apk)
-browse_btn.pack(side=tk.LEFT)
-fetch_btn = tk.Button(apk_path_frame, text="Fetch A Debuggable Apk", font=font_large, bg="#4CAF50", fg="white", width=25, height=2, command=fetch_apk)
-fetch_btn.pack(side=tk.LEFT, padx=(10, 0))
-
-# Folder selection frame (reuse UI)
-folder_frame = tk.Frame(window, bg="#f0f0f0")
-folder_frame.pack(pady=10)
-tk.Label(folder_frame, text="Use Local", font=font_large, bg="#f0f0f0").pack(side=tk.LEFT, padx=(0, 10))
-folder_var = tk.StringVar()
-folder_dropdown = ttk.Combobox(folder_frame, textvariable=folder_var, state="readonly", width=30)
-folder_dropdown.pack(side=tk.LEFT, padx=(0, 10))
-tk.Button(folder_frame, text="Use Local", font=font_medium, bg="#d3d3d3", command=on_folder_select).pack(side=tk.LEFT)
-
-# Add Install APK button after Use Local
-install_btn = tk.Button(folder_frame, text="Install APK", font=font_medium, bg="#8BC34A", fg="white", command=install_apk_from_local)
-install_btn.pack(side=tk.LEFT, padx=(10, 0))
-
-# Capture duration and Start Capture (compact)
-duration_frame = tk.Frame(window, bg="#f0f0f0")
-duration_frame.pack(pady=10)
-tk.Label(duration_frame, text="Capture Duration (s):", font=font_large, bg="#f0f0f0").pack(side=tk.LEFT, padx=(0, 10))
-duration_entry = tk.Entry(duration_frame, width=8, font=font_medium)
-duration_entry.insert(0, "10")
-duration_entry.pack(side=tk.LEFT, padx=(0, 10))
-
-# Add frequency dropdown
-freq_label = tk.Label(duration_frame, text="Frequency:", font=font_large, bg="#f0f0f0")
-freq_label.pack(side=tk.LEFT, padx=(10, 5))
-freq_dropdown = ttk.Combobox(duration_frame, textvariable=frequency_var, state="readonly", width=6, font=font_medium)
-freq_dropdown['values'] = ("1000", "2000", "3000")
-freq_dropdown.current(0)
-freq_dropdown.pack(side=tk.LEFT, padx=(0, 10))
-
-# Add --trace-offcpu toggle next to frequency
-# trace_offcpu_check = tk.Checkbutton(duration_frame, text="offcpu", variable=trace_offcpu_var, font=font_large, bg="#f0f0f0")
-# trace_offcpu_check.pack(side=tk.LEFT, padx=(0, 10))
-
-# Start Capture button
-start_btn = tk.Button(duration_frame, text="Start Capture", font=font_large, bg="#2196F3", fg="white", width=18, height=2, command=start_button_click)
-start_btn.pack(side=tk.LEFT)
-
-# Post Process Data button
-post_btn = tk.Button(window, text="Post Process Data", font=font_large, bg="#FFA500", fg="white", width=25, height=2, command=post_process_data)
-post_btn.pack(pady=15)
-
-# Console log (scrollable) - stays at the bottom
-console_frame = tk.Frame(window)
-console_frame.pack(pady=10, fill=tk.BOTH, expand=True)
-console_scrollbar = tk.Scrollbar(console_frame)
-console_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-console_log = tk.Text(console_frame, height=12, font=("Consolas", 10), bg="#222", fg="#eee", yscrollcommand=console_scrollbar.set, state=tk.DISABLED)
-console_log.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-console_scrollbar.config(command=console_log.yview)
+    scheduler.submit("install apk", lambda job: install_apk_job(apk_path, job))
+
+def install_apk_job(apk_path, job):
+    job.progress(f"Installing APK: {apk_path}", color="cyan")
+    process = subprocess.Popen(["adb", "install", "-r", apk_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    while True:
+        try:
+            _, stderr = process.communicate(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            if job.cancel_event.is_set():
+                process.terminate()
+                process.communicate()
+                raise JobCancelled(job.name)
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to install APK: {stderr}")
+    job.progress("APK installed successfully!", color="green")
+
+# Console lines and widget updates from any thread, handled by drain_log_queue on the Tk loop
+LOG_QUEUE_MAX_LINES = 20000
+LOG_BATCH_LINES = 500
+log_queue = queue.Queue(maxsize=LOG_QUEUE_MAX_LINES)
+ui_queue = queue.Queue()
+# lines dropped while the queue was full, reported by drain_log_queue
+dropped_log_lines = 0
 
 def log_message(msg, color=None):
-    console_log.config(state=tk.NORMAL)
-    start_index = console_log.index(tk.END)
-    console_log.insert(tk.END, msg + "\n")
-    end_index = console_log.index(tk.END)
-    if color:
-        console_log.tag_add(color, start_index, f"{end_index}-1c")
-        console_log.tag_config(color, foreground=color)
-    console_log.see(tk.END)
-    console_log.config(state=tk.DISABLED)
-
-# At the end of the UI setup, after all widgets are created, call update_folder_dropdown
-update_folder_dropdown()
-window.mainloop()
+    global dropped_log_lines
+    try:
+        log_queue.put_nowait((msg, color))
+    except queue.Full:
+        dropped_log_lines += 1
+
+def call_in_ui(func, *args):
+    ui_queue.put((func, args))
+
+def drain_log_queue():
+    global dropped_log_lines
+    lines = []
+    try:
+        try:
+            while len(lines) < LOG_BATCH_LINES:
+                lines.append(log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if dropped_log_lines and len(lines) < LOG_BATCH_LINES:
+            lines.append((f"... {dropped_log_lines} console lines dropped", "yellow"))
+            dropped_log_lines = 0
+        if lines:
+            console_log.config(state=tk.NORMAL)
+            for msg, color in lines:
+                start_index = console_log.index(tk.END)
+                console_log.insert(tk.END, msg + "\n")
+                end_index = console_log.index(tk.END)
+                if color:
+                    console_log.tag_add(color, start_index, f"{end_index}-1c")
+                    console_log.tag_config(color, foreground=color)
+            console_log.see(tk.END)
+            console_log.config(state=tk.DISABLED)
+
+        while True:
+            try:
+                func, args = ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            # a failing callback must not take the other queued updates down with it
+            try:
+                func(*args)
+            except Exception as e:
+                log_message(f"{getattr(func, '__name__', func)} failed: {e}", color="red")
+
+        jobs = scheduler.active_jobs()
+        jobs_label.config(text=", ".join(f"{job.name}: {job.status or job.state} {job.elapsed():.0f}s" for job in jobs) or "No running jobs")
+    finally:
+        # come back right away while a burst of lines is still queued
+        window.after(1 if len(lines) == LOG_BATCH_LINES else 50, drain_log_queue)
+
+if __name__ == "__main__":
+    # process pool workers re-import this module, only the main process builds the GUI
+    multiprocessing.freeze_support()
+
+    # Create the main window
+    window = tk.Tk()
+    frequency_var = tk.StringVar(value="1000")
+    # trace_offcpu_var = tk.BooleanVar(value=False)
+    window.title("Simpleperf Capture Tool")
+    window.geometry("800x600")  # Larger window size
+    window.configure(bg="#f0f0f0")  # Light gray background for contrast
+
+    # Custom font for better readability
+    font_large = ("Arial", 12, "bold")
+    font_medium = ("Arial", 10)
+
+    step1_label = tk.Label(window, text="Step 1: Either fetch a new APK or reuse a previous local folder.", font=("Arial", 12, "bold"), bg="#f0f0f0", fg="#AA5500")
+    step1_label.pack(pady=(20, 5))
+
+    # APK path input section (compact)
+    apk_path_frame = tk.Frame(window, bg="#f0f0f0")
+    apk_path_frame.pack(pady=10)
+    tk.Label(apk_path_frame, text="APK Path:", font=font_large, bg="#f0f0f0").pack(side=tk.LEFT, padx=(0, 10))
+    apk_entry = tk.Entry(apk_path_frame, width=40, font=font_medium)
+    apk_entry.pack(side=tk.LEFT, padx=(0, 10))
+
+    def clear_and_browse_apk():
+        apk_entry.delete(0, tk.END)
+        path = filedialog.askopenfilename()
+        if path:
+            apk_entry.insert(0, path)
+
+    browse_btn = tk.Button(apk_path_frame, text="Browse", font=font_medium, bg="#d3d3d3", command=clear_and_browse_apk)
+    browse_btn.pack(side=tk.LEFT)
+    fetch_btn = tk.Button(apk_path_frame, text="Fetch A Debuggable Apk", font=font_large, bg="#4CAF50", fg="white", width=25, height=2, command=fetch_apk)
+    fetch_btn.pack(side=tk.LEFT, padx=(10, 0))
+
+    # Folder selection frame (reuse UI)
+    folder_frame = tk.Frame(window, bg="#f0f0f0")
+    folder_frame.pack(pady=10)
+    tk.Label(folder_frame, text="Use Local", font=font_large, bg="#f0f0f0").pack(side=tk.LEFT, padx=(0, 10))
+    folder_var = tk.StringVar()
+    folder_dropdown = ttk.Combobox(folder_frame, textvariable=folder_var, state="readonly", width=30)
+    folder_dropdown.pack(side=tk.LEFT, padx=(0, 10))
+    tk.Button(folder_frame, text="Use Local", font=font_medium, bg="#d3d3d3", command=on_folder_select).pack(side=tk.LEFT)
+
+    # Add Install APK button after Use Local
+    install_btn = tk.Button(folder_frame, text="Install APK", font=font_medium, bg="#8BC34A", fg="white", command=install_apk_from_local)
+    install_btn.pack(side=tk.LEFT, padx=(10, 0))
+
+    # Capture duration and Start Capture (compact)
+    duration_frame = tk.Frame(window, bg="#f0f0f0")
+    duration_frame.pack(pady=10)
+    tk.Label(duration_frame, text="Capture Duration (s):", font=font_large, bg="#f0f0f0").pack(side=tk.LEFT, padx=(0, 10))
+    duration_entry = tk.Entry(duration_frame, width=8, font=font_medium)
+    duration_entry.insert(0, "10")
+    duration_entry.pack(side=tk.LEFT, padx=(0, 10))
+
+    # Add frequency dropdown
+    freq_label = tk.Label(duration_frame, text="Frequency:", font=font_large, bg="#f0f0f0")
+    freq_label.pack(side=tk.LEFT, padx=(10, 5))
+    freq_dropdown = ttk.Combobox(duration_frame, textvariable=frequency_var, state="readonly", width=6, font=font_medium)
+    freq_dropdown['values'] = ("1000", "2000", "3000")
+    freq_dropdown.current(0)
+    freq_dropdown.pack(side=tk.LEFT, padx=(0, 10))
+
+    # Add --trace-offcpu toggle next to frequency
+    # trace_offcpu_check = tk.Checkbutton(duration_frame, text="offcpu", variable=trace_offcpu_var, font=font_large, bg="#f0f0f0")
+    # trace_offcpu_check.pack(side=tk.LEFT, padx=(0, 10))
+
+    # Start Capture button
+    start_btn = tk.Button(duration_frame, text="Start Capture", font=font_large, bg="#2196F3", fg="white", width=18, height=2, command=start_button_click)
+    start_btn.pack(side=tk.LEFT)
+    auto_post_process_var = tk.BooleanVar(value=True)
+    tk.Checkbutton(duration_frame, text="Auto post-process", variable=auto_post_process_var, font=font_medium, bg="#f0f0f0").pack(side=tk.LEFT, padx=(10, 0))
+
+    # Post Process Data button
+    post_frame = tk.Frame(window, bg="#f0f0f0")
+    post_frame.pack(pady=15)
+    post_btn = tk.Button(post_frame, text="Post Process Data", font=font_large, bg="#FFA500", fg="white", width=25, height=2, command=lambda: post_process_data())
+    post_btn.pack(side=tk.LEFT)
+    cancel_btn = tk.Button(post_frame, text="Cancel Jobs", font=font_medium, bg="#d3d3d3", command=cancel_jobs)
+    cancel_btn.pack(side=tk.LEFT, padx=(10, 0))
+    jobs_label = tk.Label(window, text="No running jobs", font=font_medium, bg="#f0f0f0", anchor="w")
+    jobs_label.pack(fill=tk.X, padx=10)
+
+    # Console log (scrollable) - stays at the bottom
+    console_frame = tk.Frame(window)
+    console_frame.pack(pady=10, fill=tk.BOTH, expand=True)
+    console_scrollbar = tk.Scrollbar(console_frame)
+    console_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    console_log = tk.Text(console_frame, height=12, font=("Consolas", 10), bg="#222", fg="#eee", yscrollcommand=console_scrollbar.set, state=tk.DISABLED)
+    console_log.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    console_scrollbar.config(command=console_log.yview)
+
+    # At the end of the UI setup, after all widgets are created, call update_folder_dropdown
+    update_folder_dropdown()
+    drain_log_queue()
+    window.mainloop()
 
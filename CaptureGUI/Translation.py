@@ -0,0 +1,205 @@
+"""
+Name translation of gecko profiles, kept apart from Capture.py so it can be used
+without the GUI and its deps/other/config.json, e.g. by misc/benchmark_pipeline.py.
+"""
+import concurrent.futures
+import gzip
+import json
+import os
+import re
+
+# Profiles with more unique strings than this are translated in a process pool
+TRANSLATION_PROCESS_MIN_STRINGS = 1000000
+
+STRING_TABLE_KEY = re.compile(r'(?<!\\)"stringTable"\s*:\s*\[')
+STRING_TABLE_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[^"\]]+|\]')
+
+class TranslationCancelled(Exception):
+    pass
+
+def check_cancelled(cancel):
+    """cancel is a threading.Event or None, raises TranslationCancelled once it is set."""
+    if cancel is not None and cancel.is_set():
+        raise TranslationCancelled()
+
+def load_translation_dict(translation_file_path):
+    translation_dict = {}
+    with open(translation_file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if "⇨" in line:
+                obfuscated, readable = line.strip().split("⇨")
+                translation_dict[obfuscated] = readable
+    return translation_dict
+
+def translate_strings(strings, translation_dict):
+    """Translates the "_" separated words of each string, strings are expected to be unique."""
+    translated = []
+    for symbol in strings:
+        if not isinstance(symbol, str):
+            translated.append(symbol)
+            continue
+        words = symbol.split("_")
+        translated.append("_".join([translation_dict.get(word, word) for word in words]))
+    return translated
+
+_worker_translation_dict = None
+
+def _init_translation_worker(translation_dict):
+    global _worker_translation_dict
+    _worker_translation_dict = translation_dict
+
+def _translate_chunk(strings):
+    return translate_strings(strings, _worker_translation_dict)
+
+def translate_unique_strings(strings, translation_dict, workers=None, cancel=None):
+    """
+    Translates a list of unique strings, in a process pool when there are many of them.
+
+    Returns (translated strings, list of error messages). Chunks that fail are left
+    untranslated and reported instead of being dropped silently. Setting cancel stops
+    at the next chunk with TranslationCancelled.
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(strings) >= TRANSLATION_PROCESS_MIN_STRINGS else 1
+    if workers <= 1 or len(strings) < 2:
+        try:
+            return translate_strings(strings, translation_dict), []
+        except Exception as e:
+            return list(strings), [f"Translation failed: {e}"]
+
+    chunk_size = -(-len(strings) // (workers * 4))
+    chunks = [strings[i:i + chunk_size] for i in range(0, len(strings), chunk_size)]
+    translated = []
+    errors = []
+    # the dict is sent once per worker, not once per chunk
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_translation_worker,
+                                                initargs=(translation_dict,)) as executor:
+        futures = [executor.submit(_translate_chunk, chunk) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            if cancel is not None and cancel.is_set():
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise TranslationCancelled()
+            try:
+                translated.extend(future.result())
+            except Exception as e:
+                errors.append(f"Translation of {len(chunk)} strings failed: {e}")
+                translated.extend(chunk)
+    return translated, errors
+
+def translate_threads(threads, translation_dict, workers=None, cancel=None):
+    """
+    Translates the stringTable of every thread in place.
+
+    Threads share most of their symbols, so every distinct string is translated once.
+    Returns (number of distinct strings, list of error messages).
+    """
+    unique_strings = list(dict.fromkeys(entry for thread in threads for entry in thread.get("stringTable", [])))
+    translated, errors = translate_unique_strings(unique_strings, translation_dict, workers, cancel)
+    translation = dict(zip(unique_strings, translated))
+    for thread in threads:
+        thread["stringTable"] = [translation[entry] for entry in thread.get("stringTable", [])]
+    return len(unique_strings), errors
+
+def open_text(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def rewrite_string_tables(src, dst, transform, chunk_size=1 << 20, cancel=None):
+    """
+    Streams a gecko profile from src to dst, replacing each "stringTable" array by transform(array).
+
+    Everything else is copied as is, so only a chunk and one string table are in memory
+    at a time. dst can be None to only visit the tables. cancel is checked once per
+    chunk and per table.
+    """
+    def write(text):
+        if dst is not None and text:
+            dst.write(text)
+
+    buf = ""
+    eof = False
+    while True:
+        m = STRING_TABLE_KEY.search(buf)
+        if m is None:
+            if eof:
+                write(buf)
+                return
+            # keep a tail in case a key is cut at the chunk end
+            write(buf[:-256])
+            buf = buf[-256:]
+            check_cancelled(cancel)
+            chunk = src.read(chunk_size)
+            eof = not chunk
+            buf += chunk
+            continue
+
+        write(buf[:m.end() - 1])
+        buf = buf[m.end() - 1:]
+        pos = 1
+        while True:
+            token = STRING_TABLE_TOKEN.match(buf, pos)
+            # strings and "]" are complete once matched, anything else may go on in the next chunk
+            if token is not None and (token.end() < len(buf) or token.group()[0] in '"]' or eof):
+                if token.group() == "]":
+                    break
+                pos = token.end()
+                continue
+            check_cancelled(cancel)
+            chunk = src.read(chunk_size)
+            if not chunk:
+                raise ValueError("Unterminated stringTable array")
+            buf += chunk
+        table = json.loads(buf[:token.end()])
+        check_cancelled(cancel)
+        write(json.dumps(transform(table), ensure_ascii=False, separators=(",", ":")))
+        buf = buf[token.end():]
+
+def write_translated_profile(gecko_file_path, translated_file_path, translation_dict, output=None, workers=None,
+                             cancel=None):
+    """
+    Writes a translated copy of a gecko profile.
+
+    output: "stream" rewrites only the stringTable arrays without loading the whole
+    profile, "compact" loads it and writes it without indentation, "indent" is the
+    old indented output. None means "stream".
+    cancel: threading.Event, once set the translation stops with TranslationCancelled
+    and the partial output is removed.
+    Returns (number of distinct strings, list of error messages).
+    """
+    try:
+        return _write_translated_profile(gecko_file_path, translated_file_path, translation_dict,
+                                         output or "stream", workers, cancel)
+    except TranslationCancelled:
+        if os.path.exists(translated_file_path):
+            os.remove(translated_file_path)
+        raise
+
+def _write_translated_profile(gecko_file_path, translated_file_path, translation_dict, output, workers, cancel):
+    if output != "stream":
+        with open_text(gecko_file_path, "r") as f:
+            data = json.load(f)
+        check_cancelled(cancel)
+        threads = data.get("threads", [])
+        unique_count, errors = translate_threads(threads, translation_dict, workers, cancel)
+        check_cancelled(cancel)
+        with open_text(translated_file_path, "w") as f:
+            if output == "indent":
+                json.dump(data, f, indent=4)
+            else:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        return unique_count, errors
+
+    # first pass collects the distinct strings, the second writes their translations
+    unique_strings = {}
+    def collect(table):
+        unique_strings.update(dict.fromkeys(table))
+        return table
+    with open_text(gecko_file_path, "r") as src:
+        rewrite_string_tables(src, None, collect, cancel=cancel)
+    unique_strings = list(unique_strings)
+    translated, errors = translate_unique_strings(unique_strings, translation_dict, workers, cancel)
+    translation = dict(zip(unique_strings, translated))
+    with open_text(gecko_file_path, "r") as src, open_text(translated_file_path, "w") as dst:
+        rewrite_string_tables(src, dst, lambda table: [translation[entry] for entry in table], cancel=cancel)
+    return len(unique_strings), errors
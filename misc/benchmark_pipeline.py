@@ -0,0 +1,190 @@
+"""
+Times and memory-profiles each stage of resolve_stack.py on synthetic profiles of several sizes.
+
+Profiles come from make_synthetic_profile.py. Every stage runs --repeat times for the
+best time, then once more under tracemalloc for its peak memory. Results are written
+as JSON (or CSV) so runs can be compared across commits:
+
+    python benchmark_pipeline.py --sizes 10000,100000,1000000 -o bench.json
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import make_synthetic_profile
+import resolve_stack as rs
+
+# the translation step of Capture.py lives in CaptureGUI/Translation.py, which doesn't need the GUI's config
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CaptureGUI"))
+import Translation
+
+
+RESULT_FIELDS = ["samples", "stage", "items", "seconds", "mean_seconds", "items_per_s", "peak_mib", "note"]
+
+
+def measure(func, repeat, memory):
+    """Returns (best seconds, mean seconds, peak MiB or None, last result)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = peak / (1 << 20)
+    return min(times), sum(times) / len(times), peak, result
+
+
+def quiet(func):
+    """Runs func with its prints swallowed, extract_frame_metrics_with_warnings reports dropped frames."""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+    return run
+
+
+def benchmark_size(samples, args, work_dir):
+    """Runs every stage on one profile size, returns the result records."""
+    profile, translation = make_synthetic_profile.make_profile(
+        samples, args.threads, args.depth, args.unique_ratio, make_synthetic_profile.parse_phase_mix(args.phase_mix),
+        seed=args.seed)
+    path = os.path.join(work_dir, f"synthetic_{samples}.json" + (".gz" if args.gzip else ""))
+    make_synthetic_profile.write_profile(profile, path)
+    del profile
+
+    records = []
+
+    def run(stage, func, items, note=""):
+        seconds, mean_seconds, peak, result = measure(func, args.repeat, not args.no_memory)
+        records.append({
+            "samples": samples,
+            "stage": stage,
+            "items": items,
+            "seconds": round(seconds, 6),
+            "mean_seconds": round(mean_seconds, 6),
+            "items_per_s": round(items / seconds) if seconds > 0 else None,
+            "peak_mib": round(peak, 3) if peak is not None else None,
+            "note": note,
+        })
+        print(f"{samples:>9} {stage:<40} {seconds * 1000:>10.1f} ms"
+              + (f" {peak:>9.1f} MiB" if peak is not None else ""), flush=True)
+        return result
+
+    profile, min_time = run("load", lambda: rs.load_profile(path, rs.DEFAULT_THREADS), os.path.getsize(path),
+                            "items are bytes on disk")
+    thread = profile["threads"][0]
+    store = run("build_sample_store", lambda: rs.build_sample_store(thread, min_time), samples)
+
+    node_prefix, node_frame = store["node_prefix"], store["node_frame"]
+    frame_location, short_names = store["frame_location"], store["short_names"]
+    nodes = len(node_prefix)
+
+    def resolve_all():
+        cache = {}
+        for i in range(nodes):
+            rs.resolve_stack(i, node_prefix, node_frame, frame_location, short_names, cache)
+        return cache
+    resolved = run("resolve_stack", resolve_all, nodes, "every stack node, shared cache")
+
+    def label_nodes():
+        frame_masks = [rs.phase_mask(rs.frame_to_string(i, frame_location, short_names))
+                       for i in range(len(frame_location))]
+        return rs.label_stack_nodes(node_prefix, node_frame, frame_masks)
+    run("label_stack_nodes", label_nodes, nodes)
+
+    sample_stacks = np.unique(store["stacks"][store["stacks"] >= 0]).tolist()
+    run("label_sample", lambda: [rs.label_sample(resolved[i]) for i in sample_stacks], len(sample_stacks),
+        "distinct sample stacks")
+
+    run_phase, run_start, run_end = run("build_runs", lambda: rs.build_runs(store["phases"]), samples)
+    runs_before = len(run_phase)
+    run_phase, run_start, run_end, merges = run(
+        "merge_gaps", lambda: rs.merge_gaps(run_phase, run_start, run_end, store["times"]), runs_before,
+        "CleanGap")
+    times = store["times"].tolist()
+    runs = run("make_runs", lambda: rs.make_runs(run_phase, run_start, run_end, times), len(run_phase))
+    frame_runs, frame_times, _ = run("extract_frame_metrics_with_warnings",
+                                     quiet(lambda: rs.extract_frame_metrics_with_warnings(runs)), len(runs))
+    run("frame_phase_matrix", lambda: rs.frame_phase_matrix(frame_runs, store["times"]), len(frame_runs))
+    run("frame_segmenter", lambda: rs.segment_store(store), samples, "streaming path, 65536 sample chunks")
+    run("analyze_thread", quiet(lambda: rs.analyze_thread(store)), samples, "run building to frame stats")
+    del profile
+
+    strings = len(store["string_table"])
+    out = os.path.join(work_dir, f"synthetic_{samples}-translated.json")
+    for output in ("stream", "compact"):
+        run(f"translate_{output}",
+            lambda: Translation.write_translated_profile(path, out, translation, output=output, workers=1),
+            strings, "Translation.write_translated_profile, items are UnityMain strings")
+    os.remove(path)
+    return records
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the resolve_stack.py stages on synthetic profiles.")
+    parser.add_argument("--sizes", default="10000,100000,500000", help="comma separated UnityMain sample counts")
+    parser.add_argument("--threads", type=int, default=1, help="threads per profile, only UnityMain is analyzed")
+    parser.add_argument("--depth", type=int, default=24, help="average stack depth")
+    parser.add_argument("--unique-ratio", type=float, default=0.05, help="distinct stacks per sample")
+    parser.add_argument("--phase-mix", default="", help='sample share per phase, e.g. "Update=0.4,Render=0.2"')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run of each stage")
+    parser.add_argument("--gzip", action="store_true", help="load gzipped profiles")
+    parser.add_argument("-o", "--out", default="benchmark_results.json", help="result file")
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    args = parser.parse_args(argv)
+
+    started = datetime.datetime.now().isoformat(timespec="seconds")
+    records = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in (int(s) for s in args.sizes.split(",") if s):
+            records.extend(benchmark_size(size, args, work_dir))
+
+    if args.format == "csv":
+        with open(args.out, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        meta = {
+            "started": started,
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "format")},
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": records}, f, indent=2)
+    print(f"Wrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,212 @@
+"""
+Writes synthetic gecko profiles shaped like simpleperf captures of a Unity game.
+
+Every thread runs frames of FixedUpdate, Physics, Update, LateUpdate and Render
+with Other samples in between, so resolve_stack.py finds frames in them. Function
+names are "_" separated obfuscated words, written with their nameTranslation.txt
+when asked, so Capture.py's translation can run on the same profiles.
+
+    python make_synthetic_profile.py out.json.gz --samples 200000 --threads 3 --translation nameTranslation.txt
+"""
+import argparse
+import gzip
+import json
+import random
+
+
+# Frames whose names put a stack into a phase, see RAW_PHASE_PATTERNS in resolve_stack.py
+PHASE_FRAMES = {
+    "FixedUpdate": ["void CommonUpdate<FixedBehaviourManager>()"],
+    "Physics": ["PhysicsManager::FixedUpdate()", "PhysicsManager::Simulate(float)"],
+    "Update": ["void CommonUpdate<BehaviourManager>()"],
+    "LateUpdate": ["void CommonUpdate<LateBehaviourManager>()"],
+    "Render": ["PlayerRender(bool)", "RenderManager::RenderCameras()", "Camera::Render()"],
+    "Other": [],
+}
+FRAME_PHASES = ["FixedUpdate", "Physics", "Update", "LateUpdate", "Render"]
+ROOT_FRAMES = ["__start_thread", "UnityMain(void*)", "UnityPlayerLoop()", "ExecutePlayerLoop(NativePlayerLoopSystem*)"]
+OTHER_FRAMES = ["epoll_wait", "__futex_wait", "WaitForSignal(Semaphore*)", "libc.so+0x5e4c0"]
+
+DEFAULT_PHASE_MIX = {"FixedUpdate": 0.08, "Physics": 0.07, "Update": 0.3, "LateUpdate": 0.05, "Render": 0.3, "Other": 0.2}
+
+
+def parse_phase_mix(text):
+    """Parses "Update=0.3,Render=0.4,..." into weights, phases not given keep their default."""
+    mix = dict(DEFAULT_PHASE_MIX)
+    for item in filter(None, text.split(",")):
+        phase, _, weight = item.partition("=")
+        if phase not in mix:
+            raise ValueError(f"Unknown phase {phase}, expected one of {', '.join(mix)}")
+        mix[phase] = float(weight)
+    return mix
+
+
+def make_vocabulary(rng, n_words):
+    """Returns (obfuscated words, readable names) for the game functions."""
+    letters = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    obfuscated = set()
+    while len(obfuscated) < n_words:
+        obfuscated.add("".join(rng.choice(letters) for _ in range(8)))
+    obfuscated = sorted(obfuscated)
+    readable = [f"Name{i}" for i in range(n_words)]
+    return obfuscated, readable
+
+
+def make_function_names(rng, words, n_functions):
+    return [
+        "_".join(rng.choice(words) for _ in range(rng.randint(2, 4))) + "(void*)"
+        for _ in range(n_functions)
+    ]
+
+
+def make_thread(rng, name, tid, samples, start_time, interval, depth, unique_ratio, phase_mix, frame_ms,
+                broken_ratio, functions):
+    """Builds one thread of a gecko profile with samples samples."""
+    strings = list(ROOT_FRAMES) + list(OTHER_FRAMES) + functions
+    for frames in PHASE_FRAMES.values():
+        strings.extend(frames)
+    string_index = {s: i for i, s in enumerate(strings)}
+    # one frameTable entry per string keeps the mapping trivial
+    frame_table = [[i, False, None] for i in range(len(strings))]
+
+    stack_table = []
+    node_ids = {}
+
+    def stack_id(path):
+        # the stack table is a trie, every prefix gets its own node
+        prefix = None
+        for depth_i in range(len(path)):
+            key = (prefix, path[depth_i])
+            node = node_ids.get(key)
+            if node is None:
+                node = len(stack_table)
+                stack_table.append([prefix, path[depth_i]])
+                node_ids[key] = node
+            prefix = node
+        return prefix
+
+    # a pool of distinct stacks per phase, its size sets the unique-stack ratio
+    pool_size = max(1, int(samples * unique_ratio / len(phase_mix)))
+    root = [string_index[f] for f in ROOT_FRAMES]
+    function_ids = [string_index[f] for f in functions]
+    pools = {}
+    for phase in phase_mix:
+        marker = [string_index[f] for f in PHASE_FRAMES[phase]]
+        if phase == "Other":
+            marker = [string_index[rng.choice(OTHER_FRAMES)]]
+        pool = []
+        for _ in range(pool_size):
+            tail_depth = max(0, int(rng.gauss(depth, depth / 4)) - len(root) - len(marker))
+            tail = [rng.choice(function_ids) for _ in range(tail_depth)]
+            pool.append(stack_id(root + marker + tail))
+        pools[phase] = pool
+
+    # a stack that couldn't be unwound past the game code, labeled Other
+    broken_pool = [stack_id([rng.choice(function_ids) for _ in range(rng.randint(1, 4))]) for _ in range(pool_size)]
+
+    frame_weights = [phase_mix[p] for p in FRAME_PHASES]
+    frame_total = sum(frame_weights) or 1.0
+    other_share = phase_mix["Other"] / (frame_total + phase_mix["Other"])
+
+    data = []
+    t = start_time
+    while len(data) < samples:
+        # most frames hit the budget, some spike
+        frame_time = frame_ms * rng.uniform(0.8, 1.2) * (rng.uniform(2, 6) if rng.random() < 0.02 else 1)
+        for phase, weight in zip(FRAME_PHASES, frame_weights):
+            for segment_phase, share in ((phase, (1 - other_share) * weight / frame_total),
+                                         ("Other", other_share / len(FRAME_PHASES))):
+                n = int(round(frame_time * share / interval))
+                pool = pools[segment_phase]
+                for _ in range(n):
+                    if rng.random() < broken_ratio:
+                        stack = rng.choice(broken_pool)
+                    else:
+                        stack = rng.choice(pool)
+                    data.append([stack, round(t, 3), 0])
+                    t += interval
+        # sampling jitter between frames
+        t += rng.uniform(0, interval)
+    del data[samples:]
+
+    return {
+        "name": name,
+        "tid": tid,
+        "pid": 1,
+        "samples": {"schema": {"stack": 0, "time": 1, "responsiveness": 2}, "data": data},
+        "stackTable": {"schema": {"prefix": 0, "frame": 1}, "data": stack_table},
+        "frameTable": {"schema": {"location": 0, "implementation": 1, "optimizations": 2}, "data": frame_table},
+        "stringTable": strings,
+    }
+
+
+def make_profile(samples=100000, threads=1, depth=24, unique_ratio=0.05, phase_mix=None, interval=1 / 3,
+                 frame_ms=16.6, broken_ratio=0.02, functions=2000, words=3000, seed=1):
+    """
+    Returns (profile, translation) for a synthetic capture.
+
+    samples: samples of the UnityMain thread, the other threads get a quarter as many.
+    threads: number of threads, UnityMain first.
+    depth: average stack depth.
+    unique_ratio: distinct stacks per sample.
+    phase_mix: share of samples per phase, see DEFAULT_PHASE_MIX.
+    interval: ms between samples, 1/3 is simpleperf at 3000 Hz.
+    frame_ms: typical frame time.
+    broken_ratio: share of samples with a stack broken off below the phase frames.
+    functions, words: number of game functions and of obfuscated words in their names.
+    translation: {obfuscated word: readable name}, the content of nameTranslation.txt.
+    """
+    rng = random.Random(seed)
+    phase_mix = phase_mix or DEFAULT_PHASE_MIX
+    obfuscated, readable = make_vocabulary(rng, words)
+    function_names = make_function_names(rng, obfuscated, functions)
+    thread_list = []
+    for i in range(threads):
+        name, tid = ("UnityMain", 1000) if i == 0 else (f"Job.Worker {i - 1}", 1000 + i)
+        thread_samples = samples if i == 0 else max(1, samples // 4)
+        thread_list.append(make_thread(rng, name, tid, thread_samples, 1000.0 + rng.random(), interval, depth,
+                                       unique_ratio, phase_mix, frame_ms, broken_ratio, function_names))
+    profile = {"meta": {"interval": interval, "version": 24}, "libs": [], "threads": thread_list, "processes": []}
+    return profile, dict(zip(obfuscated, readable))
+
+
+def write_profile(profile, path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        json.dump(profile, f, separators=(",", ":"))
+
+
+def write_translation(translation, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for obfuscated, readable in translation.items():
+            f.write(f"{obfuscated}⇨{readable}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic gecko profile of a Unity game.")
+    parser.add_argument("out", help="output path, .json or .json.gz")
+    parser.add_argument("--samples", type=int, default=100000, help="samples of the UnityMain thread")
+    parser.add_argument("--threads", type=int, default=1, help="number of threads, UnityMain first")
+    parser.add_argument("--depth", type=int, default=24, help="average stack depth")
+    parser.add_argument("--unique-ratio", type=float, default=0.05, help="distinct stacks per sample")
+    parser.add_argument("--phase-mix", default="", help='sample share per phase, e.g. "Update=0.4,Render=0.2"')
+    parser.add_argument("--interval", type=float, default=1 / 3, help="ms between samples")
+    parser.add_argument("--frame-ms", type=float, default=16.6, help="typical frame time")
+    parser.add_argument("--broken-ratio", type=float, default=0.02, help="share of samples with broken stacks")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--translation", help="also write the nameTranslation.txt of the profile here")
+    args = parser.parse_args(argv)
+
+    profile, translation = make_profile(args.samples, args.threads, args.depth, args.unique_ratio,
+                                        parse_phase_mix(args.phase_mix), args.interval, args.frame_ms,
+                                        args.broken_ratio, seed=args.seed)
+    write_profile(profile, args.out)
+    print(f"Wrote {args.out}")
+    if args.translation:
+        write_translation(translation, args.translation)
+        print(f"Wrote {args.translation}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,13 +1,20 @@
+import argparse
+import concurrent.futures
+import csv
+import datetime
+import gzip
+import hashlib
+import itertools
 import json
+import math
+import os
 import sys
 import numpy as np
 import re
-import matplotlib.pyplot as plt
-import tkinter as tk
-from tkinter.scrolledtext import ScrolledText
 
 # see PlayerLoopCallbacks.h and Real unity profiler
-# TODO: Consider add other markers like director or animation, add more pattern   
+# TODO: Consider add other markers like director or animation, add more pattern
+# (they can be tried out with a rules file, see load_phase_rules)
 PHASE_PRIORITY = [
     "FixedUpdate",   # highest priority
     "Update",
@@ -44,84 +51,475 @@ RAW_PHASE_PATTERNS = {
     ],
 }
 
-PHASE_PATTERNS = {
-    phase: re.compile(
-        r"|".join(re.escape(pat) for pat in pats)
-    )
-    for phase, pats in RAW_PHASE_PATTERNS.items()
+# Threads analyzed when none are given, it's the main thread that we care about
+DEFAULT_THREADS = ["UnityMain"]
+
+# Broken stacks split a phase, e.g. Render => Other => Render when the stack of the
+# Other samples couldn't be unwound up to the render call.
+# (outer phase, gap phases, threshold ms): the gap runs are merged into the outer
+# phase when the two outer runs are less than threshold apart, a rules file can
+# replace them, see load_phase_rules.
+# TODO, make it more flexible, a third of average frame time?
+GAP_MERGE_RULES = [
+    ("Render", ["Other"], 6),
+]
+
+# Frame budgets (ms) counted as jank when exceeded, 60 and 30 fps
+JANK_BUDGETS_MS = [16.6, 33.3]
+# Bin edges (ms) of the frame time histogram
+FRAME_TIME_HISTOGRAM_EDGES_MS = [8.3, 16.6, 25.0, 33.3, 50.0, 66.6, 100.0]
+STATS_QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+# Phase order inside a frame (lower number = earlier in frame), used to find frame
+# boundaries, phases not listed here don't drive the segmentation
+FRAME_PHASE_ORDER = {
+    "FixedUpdate": 0,
+    "Update": 2,
+    "LateUpdate": 3,
+    "Render": 5,
 }
 
-def label_sample(frames):
-    for phase in PHASE_PRIORITY:
-        pat = PHASE_PATTERNS.get(phase)
-        if not pat:
+
+def compile_phase_matcher(priority, raw_patterns):
+    """
+    Compiles the patterns of all phases into a single regex.
+
+    Matches only where some pattern starts, so the scan itself runs inside the regex
+    engine. At each of those positions one optional lookahead group per phase records
+    whether that phase matches there, so overlapping patterns of different phases are
+    all reported. Returns (matcher, group_bits), group_bits holding the phase bit of
+    each group in order, or (None, []) when there are no patterns at all.
+    """
+    any_pattern = []
+    groups = []
+    group_bits = []
+    for i, phase in enumerate(priority):
+        pats = raw_patterns.get(phase)
+        if not pats:
+            continue
+        alternation = r"|".join(re.escape(pat) for pat in pats)
+        any_pattern.append(alternation)
+        groups.append(f"(?=(?P<p{i}>{alternation}))?")
+        group_bits.append(1 << i)
+    if not any_pattern:
+        return None, []
+    return re.compile(r"(?=" + r"|".join(any_pattern) + ")" + "".join(groups)), group_bits
+
+
+def set_phase_rules(priority, patterns, frame_order=None, gap_merge=None):
+    """
+    Replaces the phase rules used for labeling.
+
+    priority: phases from highest to lowest priority, their position is their phase code.
+    patterns: substrings of frame names per phase.
+    frame_order: optional replacement for FRAME_PHASE_ORDER.
+    gap_merge: optional replacement for GAP_MERGE_RULES.
+    """
+    global PHASE_PRIORITY, RAW_PHASE_PATTERNS, FRAME_PHASE_ORDER, GAP_MERGE_RULES
+    global PHASE_MATCHER, PHASE_GROUP_BITS, PHASE_NAMES, OTHER_CODE
+    for phase in priority:
+        if phase not in patterns:
             print("CHECK PHASE_PRIORITY AND PHASE_PATTERNS!")
-        if any(pat.search(f) for f in frames):
-            return phase
-    return "Other"
+    PHASE_PRIORITY = list(priority)
+    RAW_PHASE_PATTERNS = {phase: list(pats) for phase, pats in patterns.items()}
+    if frame_order is not None:
+        FRAME_PHASE_ORDER = dict(frame_order)
+    if gap_merge is not None:
+        GAP_MERGE_RULES = [(outer, list(gap_phases), thresh) for outer, gap_phases, thresh in gap_merge]
+    PHASE_MATCHER, PHASE_GROUP_BITS = compile_phase_matcher(PHASE_PRIORITY, RAW_PHASE_PATTERNS)
+    # Phase codes stored per sample, index into PHASE_NAMES
+    PHASE_NAMES = PHASE_PRIORITY + ["Other"]
+    OTHER_CODE = len(PHASE_PRIORITY)
+
 
+def phase_rules():
+    """Returns the current phase rules, in the format of load_phase_rules."""
+    return {"priority": PHASE_PRIORITY, "patterns": RAW_PHASE_PATTERNS,
+            "frame_order": FRAME_PHASE_ORDER, "gap_merge": GAP_MERGE_RULES}
 
-def resolve_stack(stack_index, stack_table_data, frame_table_data, string_table, stack_schema, frame_schema):
+
+def load_phase_rules(path):
     """
-    Recursively resolves a stack table entry into a list of frame strings.
-    
-    stack_index: index into the stack_table_data.
+    Loads phase rules from a JSON file and makes them current, e.g.
+
+        {"priority": ["FixedUpdate", "Update", "Director", ...],
+         "patterns": {"Director": ["DirectorManager"], ...},
+         "frame_order": {"FixedUpdate": 0, "Update": 2, "Director": 3, ...},
+         "gap_merge": [["Render", ["Other"], 6], ...]}
+
+    "frame_order" and "gap_merge" are optional. Returns the loaded rules.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    set_phase_rules(rules["priority"], rules["patterns"], rules.get("frame_order"), rules.get("gap_merge"))
+    return phase_rules()
+
+
+set_phase_rules(PHASE_PRIORITY, RAW_PHASE_PATTERNS)
+
+def phase_mask(frame_str):
+    """Returns the bitmask of all phases whose patterns match frame_str, in a single scan."""
+    mask = 0
+    if PHASE_MATCHER is None:
+        return mask
+    for m in PHASE_MATCHER.finditer(frame_str):
+        for bit, group in zip(PHASE_GROUP_BITS, m.groups()):
+            if group is not None:
+                mask |= bit
+    return mask
+
+def phase_code_from_mask(mask):
+    if not mask:
+        return OTHER_CODE
+    # the lowest set bit is the highest priority phase
+    return (mask & -mask).bit_length() - 1
+
+def phase_from_mask(mask):
+    return PHASE_NAMES[phase_code_from_mask(mask)]
+
+def label_sample(frames):
+    mask = 0
+    for f in frames:
+        mask |= phase_mask(f)
+    return phase_from_mask(mask)
+
+
+def build_stack_nodes(stack_table_data, stack_schema):
+    """
+    Resolves every stackTable entry once into a shared node.
+
     stack_table_data: list of stack table records.
-    frame_table_data: list of frame table records.
-    string_table: list of strings used in the profile.
     stack_schema: mapping for the stack table (e.g. {"prefix":0, "frame":1}).
-    frame_schema: mapping for the frame table (e.g. {"location":0}).
-    
+
+    Returns two parallel lists (node_prefix, node_frame): the parent node id of each
+    entry (-1 for a root) and its frameTable index.
+    """
+    prefix_field = stack_schema.get("prefix", 0)
+    frame_field = stack_schema.get("frame", 1)
+    node_prefix = [-1 if entry[prefix_field] is None else entry[prefix_field] for entry in stack_table_data]
+    node_frame = [entry[frame_field] for entry in stack_table_data]
+    return node_prefix, node_frame
+
+
+def build_frame_locations(frame_table_data, frame_schema):
+    """Returns the stringTable index of each frameTable entry."""
+    location_field = frame_schema.get("location", 0)
+    return [entry[location_field] for entry in frame_table_data]
+
+
+def shorten_names(string_table):
+    """
+    Returns the display name of every stringTable entry, with the argument list cut
+    off to keep the stacks short.
+    """
+    short_names = []
+    for name in string_table:
+        head, paren, _ = name.partition("(")
+        short_names.append(head.strip() if paren and head else name)
+    return short_names
+
+
+def frame_to_string(frame_idx, frame_location, names):
+    location_idx = frame_location[frame_idx]
+    return names[location_idx] if 0 <= location_idx < len(names) else "<unknown>"
+
+
+def resolve_stack(stack_index, node_prefix, node_frame, frame_location, names, cache=None):
+    """
+    Resolves a stack node into a list of frame strings.
+
+    stack_index: index into the stack nodes.
+    node_prefix, node_frame: stack nodes from build_stack_nodes.
+    frame_location: stringTable index of each frame, from build_frame_locations.
+    names: name of each stringTable entry, from shorten_names or the stringTable itself
+        for full signatures.
+    cache: optional dict of already resolved stacks, keyed by stack index.
+
+    Walks the prefix chain iteratively, so deep stacks can't hit the recursion limit,
+    and stops early at the first cached ancestor.
     Returns a list of frame strings from bottom (root) to top.
     """
-    if stack_index is None:
+    if stack_index is None or stack_index < 0:
         return []
-    entry = stack_table_data[stack_index]
-    # Using the schema to extract the prefix pointer and frame index.
-    prefix_index = entry[ stack_schema.get("prefix", 0) ]
-    frame_idx = entry[ stack_schema.get("frame", 1) ]
-    
-    # Recursively resolve any prefix entries (i.e. the rest of the call stack).
-    frames = []
-    if prefix_index is not None:
-        frames.extend(resolve_stack(prefix_index, stack_table_data, frame_table_data, string_table, stack_schema, frame_schema))
-    
-    # Now resolve the current frame using the frame table.
-    frame_record = frame_table_data[frame_idx]
-    location_idx = frame_record[ frame_schema.get("location", 0) ]
-    frame_str = string_table[location_idx] if 0 <= location_idx < len(string_table) else "<unknown>"
-    
-    # keep the stack short
-    match = re.match(r'^([^\(]+)\(', frame_str)
-    if match:
-        frames.append(match.group(1).strip())
-    else :
-        frames.append(frame_str)
-    
+    if cache is not None and stack_index in cache:
+        return cache[stack_index]
+
+    chain = []
+    base = []
+    node = stack_index
+    while node >= 0:
+        if cache is not None and node in cache:
+            base = cache[node]
+            break
+        chain.append(node)
+        node = node_prefix[node]
+
+    frames = list(base)
+    for node in reversed(chain):
+        frames.append(frame_to_string(node_frame[node], frame_location, names))
+
+    if cache is not None:
+        cache[stack_index] = frames
     return frames
 
-# Load the JSON profile
-with open(sys.argv[1], "r") as f:
-    profile = json.load(f)
+def label_stack_nodes(node_prefix, node_frame, frame_masks):
+    """
+    Labels every stack node once.
 
-global_times = []
-for thread in profile.get("threads", []):
-    samples = thread.get("samples", {})
-    sample_data = samples.get("data", [])
-    sample_schema = samples.get("schema", {})
-    time_idx = sample_schema.get("time", 1)
-    for sample in sample_data:
-        global_times.append(sample[time_idx])
-global_min_time = min(global_times) if global_times else 0
-
-results = []
-
-# Iterate over each thread
-for thread in profile.get("threads", []):
-    thread_name = thread.get("name", "Unnamed Thread")
-    tid = thread.get("tid", "N/A")
-    # print(f"Thread: {thread_name} (TID: {tid})")
-    
+    node_prefix, node_frame: stack nodes from build_stack_nodes.
+    frame_masks: phase_mask of each frameTable entry.
+
+    A node inherits its prefix's mask OR its own frame's mask, so the mask covers the
+    whole stack. Returns (node_mask, node_phase), both indexed by stack index,
+    node_phase holding phase codes.
+    """
+    node_mask = [None] * len(node_prefix)
+    for i in range(len(node_prefix)):
+        if node_mask[i] is not None:
+            continue
+        # prefixes usually come first, but walk up in case they don't
+        chain = []
+        node = i
+        while node >= 0 and node_mask[node] is None:
+            chain.append(node)
+            node = node_prefix[node]
+        mask = node_mask[node] if node >= 0 else 0
+        for node in reversed(chain):
+            mask |= frame_masks[node_frame[node]]
+            node_mask[node] = mask
+    node_phase = np.array([phase_code_from_mask(mask) for mask in node_mask], dtype=np.int8)
+    return node_mask, node_phase
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WS = re.compile(r'[ \t\n\r]*')
+_JSON_STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+_JSON_SKIP_FLAT = re.compile(r'(?:[^\[\]{}"]|\[[^\[\]{}"]*\])*')
+
+class _JsonStream:
+    """Minimal pull parser over a text stream, decodes or skips one value at a time."""
+    __slots__ = ("f", "buf", "pos", "eof", "chunk_size")
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.chunk_size = chunk_size
+
+    def _fill(self):
+        # Drop what was consumed, and grow reads with the pending data so that
+        # retrying a large value stays linear
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        data = self.f.read(max(self.chunk_size, len(self.buf)))
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = _JSON_WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f"Expected '{ch}' in JSON input, got '{self.peek()}'")
+        self.pos += 1
+
+    def _next_item(self, close):
+        ch = self.peek()
+        self.pos += 1
+        if ch == ",":
+            return True
+        if ch == close:
+            return False
+        raise ValueError(f"Expected ',' or '{close}' in JSON input, got '{ch}'")
+
+    def iter_object(self):
+        """Yields the keys of an object, the caller must decode or skip each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            yield key
+            if not self._next_item("}"):
+                return
+
+    def iter_array(self):
+        """Yields once per array item, the caller must decode or skip each item."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if not self._next_item("]"):
+                return
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number may continue in the next chunk
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        """Skips a value without building it."""
+        if self.peek() not in ("[", "{"):
+            self.decode()
+            return
+        self.pos += 1
+        depth = 1
+        while True:
+            # scalars and flat arrays, e.g. whole numeric table rows, go in one match
+            self.pos = _JSON_SKIP_FLAT.match(self.buf, self.pos).end()
+            if self.pos == len(self.buf):
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON input")
+                continue
+            ch = self.buf[self.pos]
+            if ch == '"':
+                m = _JSON_STRING.match(self.buf, self.pos)
+                if m is None:
+                    # the string goes on in the next chunk
+                    if not self._fill():
+                        raise ValueError("Unexpected end of JSON input")
+                    continue
+                self.pos = m.end()
+                continue
+            self.pos += 1
+            if ch in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+def open_profile(path):
+    """Opens a gecko profile as text, gzip compressed or not."""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def sample_min_time(samples):
+    time_idx = samples.get("schema", {}).get("time", 1)
+    return min((sample[time_idx] for sample in samples.get("data", [])), default=None)
+
+
+def thread_matches(thread, threads):
+    """True if the thread's name or tid is one of the selectors in threads."""
+    return thread.get("name", "Unnamed Thread") in threads or str(thread.get("tid", "N/A")) in threads
+
+
+def load_profile(path, threads=None, global_min_time=None):
+    """
+    Streams a gecko profile, only materializing the selected threads.
+
+    path: gecko-profile.json or gecko-profile-translated.json, optionally gzipped.
+    threads: names or tids (as strings) of the threads to keep, None keeps all of them.
+    global_min_time: earliest sample time of the profile when the caller already knows
+    it, see scan_threads.
+
+    The tables of non-selected threads are skipped while parsing, only their sample
+    times are read, and not even those when global_min_time is given. Returns
+    (profile, global_min_time), global_min_time covers the samples of every thread.
+    """
+    profile = {}
+    selected_threads = []
+    known_min_time = global_min_time
+    with open_profile(path) as f:
+        stream = _JsonStream(f)
+        for key in stream.iter_object():
+            if key != "threads":
+                profile[key] = stream.decode()
+                continue
+            for _ in stream.iter_array():
+                thread = {}
+                selected = True if threads is None else None
+                for thread_key in stream.iter_object():
+                    if selected is False and (thread_key != "samples" or known_min_time is not None):
+                        stream.skip()
+                        continue
+                    thread[thread_key] = stream.decode()
+                    # decide as soon as both name and tid are known
+                    if selected is None and thread_key in ("name", "tid"):
+                        if thread.get("name") in threads or ("tid" in thread and str(thread["tid"]) in threads):
+                            selected = True
+                        elif "name" in thread and "tid" in thread:
+                            selected = False
+                if selected is None:
+                    selected = thread_matches(thread, threads)
+
+                if known_min_time is None:
+                    min_time = sample_min_time(thread.get("samples", {}))
+                    if min_time is not None and (global_min_time is None or min_time < global_min_time):
+                        global_min_time = min_time
+                if selected:
+                    selected_threads.append(thread)
+    profile["threads"] = selected_threads
+    return profile, (global_min_time if global_min_time is not None else 0)
+
+
+def scan_threads(path):
+    """
+    Lists the threads of a gecko profile as {"name", "tid", "min_time"} dicts.
+
+    Only the names, tids and sample times are decoded, everything else is skipped.
+    """
+    threads = []
+    with open_profile(path) as f:
+        stream = _JsonStream(f)
+        for key in stream.iter_object():
+            if key != "threads":
+                stream.skip()
+                continue
+            for _ in stream.iter_array():
+                thread = {}
+                for thread_key in stream.iter_object():
+                    if thread_key in ("name", "tid", "samples"):
+                        thread[thread_key] = stream.decode()
+                    else:
+                        stream.skip()
+                threads.append({
+                    "name": thread.get("name", "Unnamed Thread"),
+                    "tid": thread.get("tid", "N/A"),
+                    "min_time": sample_min_time(thread.get("samples", {})),
+                })
+    return threads
+
+def build_sample_store(thread, global_min_time):
+    """
+    Turns a thread's samples into a columnar store of parallel NumPy arrays.
+
+    thread: a thread of the gecko profile.
+    global_min_time: earliest sample time across all threads.
+
+    Returns a dict with the thread's name and tid, "times" (ms relative to
+    global_min_time), "stacks" (stack index, -1 when there is no stack info) and
+    "phases" (phase codes, see PHASE_NAMES), plus what is needed to resolve the
+    stacks later on.
+    """
     # Get the samples and schema for the thread
     samples = thread.get("samples", {})
     sample_data = samples.get("data", [])
@@ -129,141 +527,330 @@ for thread in profile.get("threads", []):
     # Determine the field positions in each sample entry.
     stack_idx_field = sample_schema.get("stack", 0)
     time_idx_field = sample_schema.get("time", 1)
-    
+
     # Get stackTable, frameTable, and stringTable data and their schemas
     stack_table = thread.get("stackTable", {}).get("data", [])
     stack_table_schema = thread.get("stackTable", {}).get("schema", {"prefix": 0, "frame": 1})
     frame_table = thread.get("frameTable", {}).get("data", [])
     frame_table_schema = thread.get("frameTable", {}).get("schema", {"location": 0})
     string_table = thread.get("stringTable", [])
-    
-    thread_samples = []
-    for sample in sample_data:
-        sample_stack_index = sample[stack_idx_field]
-        sample_time = sample[time_idx_field]
+    node_prefix, node_frame = build_stack_nodes(stack_table, stack_table_schema)
+    frame_location = build_frame_locations(frame_table, frame_table_schema)
+    # Label each unique frame and stack once, a sample's phase is then a lookup
+    short_names = shorten_names(string_table)
+    frame_masks = [phase_mask(frame_to_string(i, frame_location, short_names)) for i in range(len(frame_location))]
+    node_mask, node_phase = label_stack_nodes(node_prefix, node_frame, frame_masks)
 
-        relative_time = float(f"{sample_time - global_min_time:.2f}")
-        
-        # Replace the stack number with a human-readable call stack string.
-        if sample_stack_index is not None and stack_table:
-            stack_frames = resolve_stack(sample_stack_index, stack_table, frame_table, string_table, stack_table_schema, frame_table_schema)
-            # You can join with an arrow or newline as preferred.
-            reversed_stack_array  = list(reversed(stack_frames))
-        else:
-            reversed_stack_array  = "No stack info"
+    n = len(sample_data)
+    times = np.fromiter((sample[time_idx_field] for sample in sample_data), dtype=np.float64, count=n)
+    stacks = np.fromiter((-1 if sample[stack_idx_field] is None else sample[stack_idx_field] for sample in sample_data), dtype=np.int32, count=n)
+    if not stack_table:
+        stacks[:] = -1
 
-        phase = label_sample(reversed_stack_array)
-        thread_samples.append({
-            "relative_time": relative_time,
-            "reversed_stack_array": reversed_stack_array,
-            "phase": phase
-        })
-    
-    thread_result = {
-        "name": thread_name,
-        "tid": tid,
-        "samples": thread_samples
+    phases = np.full(n, OTHER_CODE, dtype=np.int8)
+    has_stack = stacks >= 0
+    phases[has_stack] = node_phase[stacks[has_stack]]
+
+    return {
+        "name": thread.get("name", "Unnamed Thread"),
+        "tid": thread.get("tid", "N/A"),
+        "times": np.round(times - global_min_time, 2),
+        "stacks": stacks,
+        "phases": phases,
+        "node_prefix": node_prefix,
+        "node_frame": node_frame,
+        "frame_location": frame_location,
+        "string_table": string_table,
+        "short_names": short_names,
+        "stack_cache": {},
+        "reversed_stacks": {},
     }
-    results.append(thread_result)
-
-runs = []
-
-main_thread = next((t for t in results if t["name"] == "UnityMain"), None)
-samples = main_thread["samples"]
-prev_phase = samples[0]["phase"]
-start_idx  = 0
-for i, s in enumerate(samples[1:], start=1):
-    if s["phase"] != prev_phase:
-        end_idx = i - 1
-        runs.append({
-            "phase": prev_phase,
-            "start_i": start_idx,
-            "end_i": end_idx,
-            "start_t": samples[start_idx]["relative_time"],
-            "end_t":   samples[end_idx]["relative_time"],
-            "stacks": [s["reversed_stack_array"] for s in samples[start_idx:end_idx+1]]
-        })
-        prev_phase = s["phase"]
-        start_idx  = i
-# append the final run
-runs.append({
-    "phase": prev_phase,
-    "start_i": start_idx,
-    "end_i": len(samples)-1,
-    "start_t": samples[start_idx]["relative_time"],
-    "end_t":   samples[-1]["relative_time"],
-    "stacks": [s["reversed_stack_array"] for s in samples[start_idx:]]
-})
-
-# for r in runs:
-#     print(r)
-
-def CleanGap(origin_run, merge_thresh, count):
-    merged_runs = []
-    merge_logs  = []
-    i = 0
-
-    while i < len(origin_run):
-        cur = origin_run[i]
-
-        # Pattern: Render => Other => Render
-        if (cur["phase"] == "Render"
-            and i+2 < len(origin_run)
-            and origin_run[i+1]["phase"] == "Other"
-            and origin_run[i+2]["phase"] == "Render"):
-
-            first = cur
-            gap_run = origin_run[i+1]
-            second = origin_run[i+2]
-
-            gap = second["start_t"] - first["end_t"]
-            if gap < merge_thresh:
-                # Build a single merged Render run
-                merged = {
-                    "phase":   "Render",
-                    "start_i": first["start_i"],
-                    "end_i":   second["end_i"],
-                    "start_t": first["start_t"],
-                    "end_t":   second["end_t"],
-                    "stacks": first["stacks"] + gap_run["stacks"] + second["stacks"],
-                }
-                merged_runs.append(merged)
-                merge_logs.append(
-                    f"Merged Other at {first['end_t']}->{second['start_t']} "
-                    f"(gap {gap} ms, dropped phase {gap_run['phase']} : {gap_run['stacks']})"
-                )
-                i += 3
+
+
+def node_stack(store, stack_index, full=False):
+    """
+    Returns the frame strings of a stack node from top to bottom (root).
+
+    full: use the full signatures instead of the short names, these are not cached.
+    """
+    if stack_index < 0:
+        return "No stack info"
+    if full:
+        stack_frames = resolve_stack(stack_index, store["node_prefix"], store["node_frame"], store["frame_location"],
+                                     store["string_table"])
+        return list(reversed(stack_frames))
+    reversed_stack_array = store["reversed_stacks"].get(stack_index)
+    if reversed_stack_array is None:
+        stack_frames = resolve_stack(stack_index, store["node_prefix"], store["node_frame"], store["frame_location"],
+                                     store["short_names"], store["stack_cache"])
+        reversed_stack_array = list(reversed(stack_frames))
+        store["reversed_stacks"][stack_index] = reversed_stack_array
+    return reversed_stack_array
+
+
+def sample_stack(store, sample_i, full=False):
+    """Returns the frame strings of a sample from top to bottom (root), see node_stack."""
+    return node_stack(store, int(store["stacks"][sample_i]), full)
+
+
+def build_runs(phases):
+    """
+    Run-length encodes the phase codes of a sample store.
+
+    Returns (run_phase, run_start, run_end) arrays, run_end being inclusive.
+    """
+    if len(phases) == 0:
+        empty = np.array([], dtype=np.int64)
+        return phases[:0], empty, empty
+    change = np.flatnonzero(phases[1:] != phases[:-1]) + 1
+    run_start = np.concatenate(([0], change))
+    run_end = np.concatenate((change, [len(phases)])) - 1
+    return phases[run_start], run_start, run_end
+
+
+def merge_gaps(run_phase, run_start, run_end, times, rules=None):
+    """
+    Merges broken "outer => gap => outer" run patterns until nothing changes.
+
+    run_phase, run_start, run_end: runs from build_runs.
+    times: sample times of the store the runs come from.
+    rules: list of (outer phase, gap phases, threshold ms), the current
+           GAP_MERGE_RULES when None.
+
+    Each pass is a vectorized scan over all runs, so chains like
+    Render => Other => Render => Other => Render collapse at once.
+    Returns (run_phase, run_start, run_end, merges), merges being a dict of parallel
+    arrays describing each dropped gap run: "phase", "start_i", "end_i" and "gap_ms".
+    """
+    if rules is None:
+        rules = GAP_MERGE_RULES
+    rule_codes = [
+        (PHASE_NAMES.index(outer), [PHASE_NAMES.index(p) for p in gap_phases if p in PHASE_NAMES], thresh)
+        for outer, gap_phases, thresh in rules
+        if outer in PHASE_NAMES
+    ]
+    merged = []
+    changed = True
+    while changed:
+        changed = False
+        for outer, gap_codes, thresh in rule_codes:
+            if len(run_phase) < 3:
+                break
+            gap_ms = times[run_start[2:]] - times[run_end[:-2]]
+            hit = ((run_phase[:-2] == outer) & (run_phase[2:] == outer)
+                   & np.isin(run_phase[1:-1], gap_codes) & (gap_ms < thresh))
+            if not hit.any():
                 continue
+            gaps = np.flatnonzero(hit) + 1
+            merged.append((run_phase[gaps], run_start[gaps], run_end[gaps], gap_ms[gaps - 1]))
 
-        # otherwise, just keep the current run
-        merged_runs.append(cur)
-        i += 1
-    
-    # Optional: print out merge logs
-    print(f"========= {count} =========")
-    for log in merge_logs:
-        print(log)
-    print(f"========= {count} over =========")
+            # drop each gap run and the outer run after it, the run before absorbs both
+            keep = np.ones(len(run_phase), dtype=bool)
+            keep[gaps] = False
+            keep[gaps + 1] = False
+            first = np.flatnonzero(keep)
+            last = np.concatenate((first[1:] - 1, [len(run_phase) - 1]))
+            run_phase, run_start, run_end = run_phase[first], run_start[first], run_end[last]
+            changed = True
 
-    return merged_runs
+    merges = {
+        "phase": np.concatenate([m[0] for m in merged]) if merged else run_phase[:0],
+        "start_i": np.concatenate([m[1] for m in merged]) if merged else run_start[:0],
+        "end_i": np.concatenate([m[2] for m in merged]) if merged else run_end[:0],
+        "gap_ms": np.concatenate([m[3] for m in merged]) if merged else times[:0],
+    }
+    return run_phase, run_start, run_end, merges
 
-# Do twice to compress more 
-# Render => Other => Render => Other
-# TODO, make it more flexible, a third of average frame time?
-runs = CleanGap(runs, 6, 0)
-runs = CleanGap(runs, 6, 1)
 
-for r in runs:
-    print(r)
+# Bump when the layout of the analysis cache changes
+ANALYSIS_CACHE_VERSION = 1
+
+def pattern_version():
+    """Hash of the phase rules, cached phases are only valid for the rules they were labeled with."""
+    rules = json.dumps([PHASE_PRIORITY, RAW_PHASE_PATTERNS], sort_keys=True)
+    return hashlib.sha1(rules.encode("utf-8")).hexdigest()[:16]
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def remembered(path, name, compute):
+    """
+    compute(path), remembered in <path>.<name>.json by the file's size and mtime so it
+    isn't recomputed while the file is unchanged.
+    """
+    stat = os.stat(path)
+    fingerprint = [stat.st_size, stat.st_mtime_ns]
+    index_path = f"{path}.{name}.json"
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index["fingerprint"] == fingerprint:
+            return index["value"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    value = compute(path)
+    # workers of analyze_profile may race here, each writes aside and swaps
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "value": value}, f)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        print(f"Failed to write {index_path}: {e}")
+    return value
+
+
+def profile_hash(path):
+    """file_hash of a profile, only recomputed when the profile's size or mtime changed."""
+    return remembered(path, "hash", file_hash)
+
+
+def analysis_cache_path(profile_path, selection):
+    # one cache per thread selection, so workers analyzing different threads don't collide
+    return f"{profile_path}.{hashlib.sha1(selection.encode('utf-8')).hexdigest()[:8]}.analysis.npz"
+
+
+def _pack_strings(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.array([len(e) for e in encoded], dtype=np.int64))
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    offsets = offsets.tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def save_analysis_cache(cache_path, key, stores):
+    """Writes the sample stores to an uncompressed .npz, see load_analysis_cache."""
+    arrays = {"key": np.array(key)}
+    threads = []
+    for i, store in enumerate(stores):
+        threads.append({"name": store["name"], "tid": store["tid"]})
+        for field in ("times", "stacks", "phases"):
+            arrays[f"{i}_{field}"] = store[field]
+        for field in ("node_prefix", "node_frame", "frame_location"):
+            arrays[f"{i}_{field}"] = np.asarray(store[field], dtype=np.int32)
+        arrays[f"{i}_strings"], arrays[f"{i}_string_offsets"] = _pack_strings(store["string_table"])
+    arrays["threads"] = np.array(json.dumps(threads))
+
+    # write aside and swap, so an interrupted run never leaves a broken cache
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, cache_path)
+
+
+def load_analysis_cache(cache_path, key):
+    """Returns the cached sample stores, or None when the cache is missing or stale."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path) as cache:
+            if str(cache["key"]) != key:
+                return None
+            stores = []
+            for i, thread in enumerate(json.loads(str(cache["threads"]))):
+                string_table = _unpack_strings(cache[f"{i}_strings"], cache[f"{i}_string_offsets"])
+                stores.append({
+                    "name": thread["name"],
+                    "tid": thread["tid"],
+                    "times": cache[f"{i}_times"],
+                    "stacks": cache[f"{i}_stacks"],
+                    "phases": cache[f"{i}_phases"],
+                    "node_prefix": cache[f"{i}_node_prefix"].tolist(),
+                    "node_frame": cache[f"{i}_node_frame"].tolist(),
+                    "frame_location": cache[f"{i}_frame_location"].tolist(),
+                    "string_table": string_table,
+                    "short_names": shorten_names(string_table),
+                    "stack_cache": {},
+                    "reversed_stacks": {},
+                })
+            return stores
+    except Exception as e:
+        print(f"Ignoring unreadable analysis cache {cache_path}: {e}")
+        return None
+
+
+def load_thread_stores(path, threads=None, use_cache=True, content_hash=None, global_min_time=None):
+    """
+    Returns the sample stores of the selected threads of a profile.
+
+    threads: names or tids of the threads to analyze, None for all of them.
+    content_hash: profile_hash of the profile when the caller already knows it.
+    global_min_time: earliest sample time of the profile when the caller already knows it.
+
+    The stores come from the analysis cache next to the profile when it matches the
+    profile's content hash, the phase rules and the thread selection. The content
+    hash is only recomputed when the profile's size or mtime changed. Otherwise the
+    profile is parsed and the cache is rewritten.
+    """
+    if use_cache:
+        selection = "*" if threads is None else ",".join(sorted(threads))
+        key = f"{ANALYSIS_CACHE_VERSION}:{content_hash or profile_hash(path)}:{pattern_version()}:{selection}"
+        cache_path = analysis_cache_path(path, selection)
+        stores = load_analysis_cache(cache_path, key)
+        if stores is not None:
+            print(f"Loaded analysis cache {cache_path}")
+            return stores
+
+    profile, global_min_time = load_profile(path, threads, global_min_time)
+    stores = [build_sample_store(thread, global_min_time) for thread in profile.get("threads", [])]
+
+    if use_cache:
+        try:
+            save_analysis_cache(cache_path, key, stores)
+        except OSError as e:
+            print(f"Failed to write analysis cache {cache_path}: {e}")
+    return stores
+
+
+class Run:
+    """A run of consecutive samples with the same phase, viewing a range of a sample store."""
+    __slots__ = ("phase", "start_i", "end_i", "start_t", "end_t")
+
+    def __init__(self, phase, start_i, end_i, start_t, end_t):
+        self.phase = phase
+        self.start_i = start_i
+        self.end_i = end_i
+        self.start_t = start_t
+        self.end_t = end_t
+
+    def __len__(self):
+        return self.end_i - self.start_i + 1
+
+    def __repr__(self):
+        return f"Run({self.phase}, samples {self.start_i}-{self.end_i}, {self.start_t:.2f}-{self.end_t:.2f} ms)"
+
+    def stacks(self, store, full=False):
+        """Resolves the stacks of the run's samples, only meant for inspecting a frame."""
+        return [sample_stack(store, i, full) for i in range(self.start_i, self.end_i + 1)]
+
+    def stack_counts(self, store):
+        """The run's distinct stack ids with their sample count, most common first."""
+        stacks, counts = np.unique(store["stacks"][self.start_i:self.end_i + 1], return_counts=True)
+        order = np.argsort(-counts, kind="stable")
+        return list(zip(stacks[order].tolist(), counts[order].tolist()))
+
+
+def make_runs(run_phase, run_start, run_end, times):
+    return [
+        Run(PHASE_NAMES[phase], start_i, end_i, times[start_i], times[end_i])
+        for phase, start_i, end_i in zip(run_phase.tolist(), run_start.tolist(), run_end.tolist())
+    ]
+
 
 def extract_frame_metrics_with_warnings(runs, min_frame_time = 6):
-    # Define phase order (lower number = earlier in frame)
-    phase_order = {
-        "FixedUpdate": 0,
-        "Update": 2,
-        "LateUpdate": 3,
-        "Render": 5,
-    }
+    # Phase order (lower number = earlier in frame)
+    phase_order = FRAME_PHASE_ORDER
     
     frame_boundaries = []
     frame_runs = []
@@ -273,14 +860,14 @@ def extract_frame_metrics_with_warnings(runs, min_frame_time = 6):
     last_was_render = False
     
     for idx, run in enumerate(runs):
-        phase = run["phase"]
+        phase = run.phase
         
         # Skip "Other" and "Physics" phases for sequence detection
         if phase == "Other" or phase == "Physics":
             # If last phase was Render, even "Other" or "Physics" starts a new frame
             if last_was_render and idx > current_frame_start_idx:
                 frame_runs.append(runs[current_frame_start_idx:idx])
-                frame_boundaries.append(run["start_t"])
+                frame_boundaries.append(run.start_t)
                 current_frame_start_idx = idx
                 last_phase_order = -1
                 last_was_render = False
@@ -298,7 +885,7 @@ def extract_frame_metrics_with_warnings(runs, min_frame_time = 6):
                 # Store the previous frame
                 frame_runs.append(runs[current_frame_start_idx:idx])
                 # Use the start of the new frame as boundary
-                frame_boundaries.append(run["start_t"])
+                frame_boundaries.append(run.start_t)
             current_frame_start_idx = idx
             last_phase_order = phase_num
             last_was_render = False
@@ -319,9 +906,9 @@ def extract_frame_metrics_with_warnings(runs, min_frame_time = 6):
     
     if len(frame_runs) > 0:
         # Insert the start time of the first frame at the beginning
-        frame_boundaries.insert(0, frame_runs[0][0]["start_t"])
+        frame_boundaries.insert(0, frame_runs[0][0].start_t)
         # Add the end time of the last frame at the end
-        frame_boundaries.append(frame_runs[-1][-1]["end_t"])
+        frame_boundaries.append(frame_runs[-1][-1].end_t)
     
     # Drop first and last frames as they are often partial
     if len(frame_runs) > 2:
@@ -342,95 +929,1136 @@ def extract_frame_metrics_with_warnings(runs, min_frame_time = 6):
     
     return frame_runs, frame_times, warnings
 
-# ——— USAGE ———
-# after you've built (and maybe merged) `runs`:
-frame_runs, frame_times, warns = extract_frame_metrics_with_warnings(runs)
-stats = {}
-if frame_times.size > 0:
-    stats = {
-        "avg_ms": np.mean(frame_times),
-        "min_ms": np.min(frame_times),
-        "max_ms": np.max(frame_times),
+
+class FrameSegmenter:
+    """
+    Splits a stream of labeled samples into frames in constant memory.
+
+    Gives the same frames as build_runs, merge_gaps and
+    extract_frame_metrics_with_warnings on the whole store: feed() takes the next
+    chunk of sample times and phase codes and returns the frames it completed,
+    finish() returns the remaining ones. Frames are (runs, frame_time) pairs, and
+    only the runs of the current frame plus the last two runs are kept.
+
+    A run only becomes part of a frame once the run after it has started and could
+    not be merged over it. That is final as long as no phase is both an outer and a
+    gap phase of the merge rules, which is checked up front.
+    """
+
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = GAP_MERGE_RULES
+        self.rules = [
+            (outer, set(gap_phases), thresh)
+            for outer, gap_phases, thresh in rules
+            if outer in PHASE_NAMES
+        ]
+        outer_phases = {outer for outer, _, _ in self.rules}
+        if any(outer_phases & gap_phases for _, gap_phases, _ in self.rules):
+            raise ValueError("FrameSegmenter needs gap merge rules whose outer and gap phases don't overlap")
+        self.sample_count = 0
+        self.merged_gaps = 0
+        self.last_time = None
+        self.window = []          # last two runs, the newest one still open
+        self.top_added = False    # the open run already belongs to a frame after a merge
+        self.frame = []           # runs of the current frame
+        self.frames_seen = 0
+        self.first_frame = None   # held back until we know if it gets dropped
+        self.last_phase_order = -1
+        self.last_was_render = False
+
+    def feed(self, times, phases):
+        """Adds the next chunk of samples and returns the frames completed by it."""
+        completed = []
+        if len(phases) == 0:
+            return completed
+        times = np.asarray(times)
+        times_list = times.tolist()
+        run_phase, run_start, run_end = build_runs(np.asarray(phases))
+        offset = self.sample_count
+        for phase, start_i, end_i in zip(run_phase.tolist(), run_start.tolist(), run_end.tolist()):
+            phase = PHASE_NAMES[phase]
+            if self.window and start_i == 0 and self.window[-1].phase == phase:
+                # the open run goes on in this chunk
+                top = self.window[-1]
+            else:
+                if self.window:
+                    top = self.window[-1]
+                    top.end_i = offset + start_i - 1
+                    top.end_t = times_list[start_i - 1] if start_i > 0 else self.last_time
+                top = Run(phase, offset + start_i, offset + end_i, times_list[start_i], times_list[end_i])
+                self._push(top, completed)
+                top = self.window[-1]
+            top.end_i = offset + end_i
+            top.end_t = times_list[end_i]
+        self.sample_count += len(phases)
+        self.last_time = times_list[-1]
+        return completed
+
+    def finish(self):
+        """Ends the stream and returns the last frames, dropping partial ones like the batch path."""
+        completed = []
+        if self.window and not self.top_added:
+            self._add_run(self.window[-1], completed)
+        self.window = []
+        if self.frame:
+            last = (self.frame, self.frame[-1].end_t - self.frame[0].start_t)
+            if self.frames_seen < 2:
+                # two frames or less, nothing gets dropped
+                if self.first_frame is not None:
+                    completed.append(self.first_frame)
+                completed.append(last)
+            self.frame = []
+        self.first_frame = None
+        return completed
+
+    def _push(self, run, completed):
+        if len(self.window) == 2:
+            left, gap = self.window
+            for outer, gap_phases, thresh in self.rules:
+                if (left.phase == outer and run.phase == outer and gap.phase in gap_phases
+                        and run.start_t - left.end_t < thresh):
+                    # left absorbs the gap and this run, and is open again
+                    self.window.pop()
+                    self.merged_gaps += 1
+                    self.top_added = True
+                    return
+        if self.window and not self.top_added:
+            self._add_run(self.window[-1], completed)
+        self.window = self.window[-1:] + [run]
+        self.top_added = False
+
+    def _add_run(self, run, completed):
+        # one step of extract_frame_metrics_with_warnings
+        phase = run.phase
+        if phase == "Other" or phase == "Physics":
+            if self.last_was_render and self.frame:
+                self._start_frame(run, completed)
+                self.last_phase_order = -1
+                self.last_was_render = False
+            else:
+                self.frame.append(run)
+            return
+        phase_num = FRAME_PHASE_ORDER.get(phase, 6)
+        if phase_num < self.last_phase_order or self.last_was_render:
+            self._start_frame(run, completed)
+        else:
+            self.frame.append(run)
+        self.last_phase_order = phase_num
+        self.last_was_render = (phase == "Render")
+
+    def _start_frame(self, run, completed):
+        if self.frame:
+            frame = (self.frame, run.start_t - self.frame[0].start_t)
+            self.frames_seen += 1
+            if self.frames_seen == 1:
+                self.first_frame = frame
+            else:
+                # a third frame has started, so the first one is dropped
+                self.first_frame = None
+                completed.append(frame)
+        self.frame = [run]
+
+
+def segment_store(store, chunk_size=1 << 16):
+    """Runs a sample store through a FrameSegmenter chunk by chunk, returns (frame_runs, frame_times)."""
+    segmenter = FrameSegmenter()
+    frames = []
+    for start in range(0, len(store["phases"]), chunk_size):
+        end = start + chunk_size
+        frames.extend(segmenter.feed(store["times"][start:end], store["phases"][start:end]))
+    frames.extend(segmenter.finish())
+    return [runs for runs, _ in frames], np.array([frame_time for _, frame_time in frames])
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch with relative accuracy (DDSketch style).
+
+    Values are counted in logarithmic buckets, so memory only depends on the range of
+    the values, not their number, and two sketches merge by adding bucket counts.
+    Quantiles are within relative_accuracy of the exact value.
+    """
+    __slots__ = ("relative_accuracy", "log_gamma", "buckets", "zero_count", "count", "total", "min", "max")
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > 0]
+        self.zero_count += values.size - positive.size
+        keys, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Can't merge quantile sketches of different accuracy")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return max(self.min, 0.0)
+        gamma = math.exp(self.log_gamma)
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                # middle of the bucket, relative to its bounds
+                value = 2 * gamma ** key / (gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "buckets": {str(key): count for key, count in self.buckets.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"])
+        sketch.buckets = {int(key): count for key, count in data["buckets"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.total = data["total"]
+        if sketch.count:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+
+class FrameTimeStats:
+    """
+    Mergeable frame time statistics of one or more captures.
+
+    Holds quantile sketches of the frame times and of the time spent in each phase per
+    frame, jank counts per JANK_BUDGETS_MS and a histogram over
+    FRAME_TIME_HISTOGRAM_EDGES_MS. No frame time is kept, so long captures or many
+    captures can be combined with merge.
+    """
+    __slots__ = ("frames", "phases", "jank", "histogram")
+
+    def __init__(self):
+        self.frames = QuantileSketch()
+        self.phases = {}
+        self.jank = [0] * len(JANK_BUDGETS_MS)
+        self.histogram = [0] * (len(FRAME_TIME_HISTOGRAM_EDGES_MS) + 1)
+
+    def add(self, frame_times, phase_matrix=None, phase_names=None):
+        """
+        frame_times: frame times in ms.
+        phase_matrix: optional (frames, phases) matrix of ms spent per phase, see
+            frame_phase_matrix, with phase_names naming its columns.
+        """
+        frame_times = np.asarray(frame_times, dtype=np.float64)
+        self.frames.add(frame_times)
+        for i, budget in enumerate(JANK_BUDGETS_MS):
+            self.jank[i] += int(np.count_nonzero(frame_times > budget))
+        bins = np.bincount(np.searchsorted(FRAME_TIME_HISTOGRAM_EDGES_MS, frame_times, side="right"),
+                           minlength=len(self.histogram))
+        self.histogram = [a + b for a, b in zip(self.histogram, bins.tolist())]
+        if phase_matrix is not None:
+            for j, phase in enumerate(phase_names):
+                self.phases.setdefault(phase, QuantileSketch()).add(phase_matrix[:, j])
+
+    def merge(self, other):
+        self.frames.merge(other.frames)
+        for phase, sketch in other.phases.items():
+            self.phases.setdefault(phase, QuantileSketch(sketch.relative_accuracy)).merge(sketch)
+        self.jank = [a + b for a, b in zip(self.jank, other.jank)]
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    def summary(self):
+        """Plain data summary: frame count, avg/min/max, percentiles, jank, histogram and per-phase percentiles."""
+        if self.frames.count == 0:
+            return {}
+        stats = {
+            "frames": self.frames.count,
+            "avg_ms": self.frames.mean(),
+            "min_ms": self.frames.min,
+            "max_ms": self.frames.max,
+        }
+        for q in STATS_QUANTILES:
+            stats[f"p{q * 100:g}_ms"] = self.frames.quantile(q)
+        stats["jank"] = {f">{budget}ms": count for budget, count in zip(JANK_BUDGETS_MS, self.jank)}
+        labels = [f"<{FRAME_TIME_HISTOGRAM_EDGES_MS[0]}"]
+        labels += [f"{a}-{b}" for a, b in zip(FRAME_TIME_HISTOGRAM_EDGES_MS[:-1], FRAME_TIME_HISTOGRAM_EDGES_MS[1:])]
+        labels += [f">={FRAME_TIME_HISTOGRAM_EDGES_MS[-1]}"]
+        stats["histogram"] = dict(zip(labels, self.histogram))
+        stats["phases"] = {
+            phase: dict({"avg_ms": sketch.mean()}, **{f"p{q * 100:g}_ms": sketch.quantile(q) for q in STATS_QUANTILES})
+            for phase, sketch in self.phases.items()
+        }
+        return stats
+
+    def to_dict(self):
+        return {
+            "jank_budgets_ms": JANK_BUDGETS_MS,
+            "histogram_edges_ms": FRAME_TIME_HISTOGRAM_EDGES_MS,
+            "frames": self.frames.to_dict(),
+            "phases": {phase: sketch.to_dict() for phase, sketch in self.phases.items()},
+            "jank": self.jank,
+            "histogram": self.histogram,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data["jank_budgets_ms"] != JANK_BUDGETS_MS or data["histogram_edges_ms"] != FRAME_TIME_HISTOGRAM_EDGES_MS:
+            raise ValueError("Frame stats were computed with other jank budgets or histogram edges")
+        stats = cls()
+        stats.frames = QuantileSketch.from_dict(data["frames"])
+        stats.phases = {phase: QuantileSketch.from_dict(sketch) for phase, sketch in data["phases"].items()}
+        stats.jank = list(data["jank"])
+        stats.histogram = list(data["histogram"])
+        return stats
+
+
+def frame_sample_ranges(frame_runs):
+    """Returns (start_i, end_i) arrays with the sample range of each frame, end_i inclusive."""
+    start_i = np.array([runs[0].start_i for runs in frame_runs], dtype=np.int64)
+    end_i = np.array([runs[-1].end_i for runs in frame_runs], dtype=np.int64)
+    return start_i, end_i
+
+
+def frame_phase_matrix(frame_runs, times):
+    """
+    Returns the ms spent in each phase of each frame, a (frames, PHASE_NAMES) matrix.
+
+    A run lasts from its first sample up to the sample after it, so the runs of a
+    frame add up to the frame's span.
+    """
+    times = np.asarray(times)
+    codes = {phase: j for j, phase in enumerate(PHASE_NAMES)}
+    matrix = np.zeros((len(frame_runs), len(PHASE_NAMES)))
+    flat_runs = [r for runs in frame_runs for r in runs]
+    if not flat_runs:
+        return matrix
+    run_frame = np.repeat(np.arange(len(frame_runs)), [len(runs) for runs in frame_runs])
+    run_code = np.array([codes[r.phase] for r in flat_runs])
+    run_start = np.array([r.start_i for r in flat_runs])
+    run_next = np.minimum(np.array([r.end_i for r in flat_runs]) + 1, len(times) - 1)
+    np.add.at(matrix, (run_frame, run_code), times[run_next] - times[run_start])
+    return matrix
+
+
+def function_table(store):
+    """
+    Maps the stack nodes of a store to functions, identified by their short name.
+
+    Returns (function_names, node_function, ancestors_ptr, ancestors): the function id
+    of each node's own frame, and in CSR form the distinct function ids on each node's
+    path to the root. Computed once per store.
+    """
+    if "function_table" in store:
+        return store["function_table"]
+    function_ids = {}
+    string_function = [function_ids.setdefault(name, len(function_ids)) for name in store["short_names"]]
+    unknown = function_ids.setdefault("<unknown>", len(function_ids))
+    frame_function = [string_function[loc] if 0 <= loc < len(string_function) else unknown
+                      for loc in store["frame_location"]]
+    node_prefix = store["node_prefix"]
+    node_function = [frame_function[frame] for frame in store["node_frame"]]
+
+    node_ancestors = [None] * len(node_prefix)
+    for i in range(len(node_prefix)):
+        if node_ancestors[i] is not None:
+            continue
+        chain = []
+        node = i
+        while node >= 0 and node_ancestors[node] is None:
+            chain.append(node)
+            node = node_prefix[node]
+        functions = node_ancestors[node] if node >= 0 else frozenset()
+        for node in reversed(chain):
+            if node_function[node] not in functions:
+                functions = functions | {node_function[node]}
+            node_ancestors[node] = functions
+
+    ancestors_ptr = np.zeros(len(node_prefix) + 1, dtype=np.int64)
+    ancestors_ptr[1:] = np.cumsum([len(functions) for functions in node_ancestors])
+    ancestors = np.fromiter(itertools.chain.from_iterable(node_ancestors), dtype=np.int64, count=int(ancestors_ptr[-1]))
+    store["function_table"] = (list(function_ids), np.array(node_function, dtype=np.int64), ancestors_ptr, ancestors)
+    return store["function_table"]
+
+
+def _top_per_frame(frame, function, count, n_frames, top_n, function_names):
+    n_functions = len(function_names)
+    key, inverse = np.unique(frame * n_functions + function, return_inverse=True)
+    total = np.bincount(inverse, weights=count)
+    key_frame = key // n_functions
+    key_function = key % n_functions
+    # per frame, highest count first
+    order = np.lexsort((-total, key_frame))
+    key_frame, key_function, total = key_frame[order], key_function[order], total[order]
+    rank = np.arange(len(key_frame)) - np.searchsorted(key_frame, key_frame, side="left")
+    keep = rank < top_n
+    top = [[] for _ in range(n_frames)]
+    for f, function, c in zip(key_frame[keep].tolist(), key_function[keep].tolist(), total[keep].tolist()):
+        top[f].append((function_names[function], int(c)))
+    return top
+
+
+def frame_hot_functions(store, frame_runs, top_n=10):
+    """
+    Returns the top_n functions of every frame by self and by inclusive sample count.
+
+    Samples are counted per (frame, stack node) first, then the counts of each node go
+    to its own function (self) and to every distinct function on its path (inclusive),
+    so no stack is resolved to strings. Returns {"self": [...], "inclusive": [...]},
+    each holding a list of (function name, samples) per frame, highest first.
+    """
+    n_frames = len(frame_runs)
+    if n_frames == 0:
+        return {"self": [], "inclusive": []}
+    function_names, node_function, ancestors_ptr, ancestors = function_table(store)
+
+    start_i, end_i = frame_sample_ranges(frame_runs)
+    lengths = end_i - start_i + 1
+    sample_frame = np.repeat(np.arange(n_frames), lengths)
+    sample_i = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - start_i, lengths)
+    sample_node = store["stacks"][sample_i].astype(np.int64)
+    has_stack = sample_node >= 0
+    sample_frame, sample_node = sample_frame[has_stack], sample_node[has_stack]
+
+    n_nodes = max(len(node_function), 1)
+    pair, count = np.unique(sample_frame * n_nodes + sample_node, return_counts=True)
+    pair_frame = pair // n_nodes
+    pair_node = pair % n_nodes
+    hot_self = _top_per_frame(pair_frame, node_function[pair_node], count, n_frames, top_n, function_names)
+
+    # expand each (frame, node) pair into the functions on the node's path
+    path_lengths = ancestors_ptr[pair_node + 1] - ancestors_ptr[pair_node]
+    path_offsets = np.cumsum(path_lengths) - path_lengths
+    path_i = np.arange(path_lengths.sum()) - np.repeat(path_offsets - ancestors_ptr[pair_node], path_lengths)
+    hot_inclusive = _top_per_frame(np.repeat(pair_frame, path_lengths), ancestors[path_i],
+                                   np.repeat(count, path_lengths), n_frames, top_n, function_names)
+    return {"self": hot_self, "inclusive": hot_inclusive}
+
+
+def slowest_frames(result, n=10, phase=None):
+    """Indices of the n slowest frames, by frame time or by the time spent in phase."""
+    if phase is None:
+        values = result["frame_times"]
+    else:
+        values = result["phase_matrix"][:, PHASE_NAMES.index(phase)]
+    return np.argsort(-np.asarray(values), kind="stable")[:n]
+
+
+def analyze_thread(store, top_n=0):
+    """
+    Segments a thread's sample store into runs and frames.
+
+    top_n: number of hot functions per frame to find, 0 for none.
+
+    Returns a dict with the thread's name and tid, the store, its runs, the gap merges,
+    the frame_runs, frame_times and warnings of extract_frame_metrics_with_warnings, the
+    frame_phase_matrix, the FrameTimeStats of the frames and the frame_hot_functions
+    of every frame, or None.
+    """
+    times = store["times"].tolist()
+    run_phase, run_start, run_end = build_runs(store["phases"])
+    run_phase, run_start, run_end, merges = merge_gaps(run_phase, run_start, run_end, store["times"])
+    runs = make_runs(run_phase, run_start, run_end, times)
+    frame_runs, frame_times, warnings = extract_frame_metrics_with_warnings(runs)
+    phase_matrix = frame_phase_matrix(frame_runs, store["times"])
+    stats = FrameTimeStats()
+    stats.add(frame_times, phase_matrix, PHASE_NAMES)
+    return {
+        "name": store["name"],
+        "tid": store["tid"],
+        "store": store,
+        "runs": runs,
+        "merges": merges,
+        "frame_runs": frame_runs,
+        "frame_times": frame_times,
+        "warnings": warnings,
+        "phase_matrix": phase_matrix,
+        "stats": stats,
+        "hot": frame_hot_functions(store, frame_runs, top_n) if top_n > 0 else None,
     }
-print(f"Detected frames: {len(frame_runs)}")
-if frame_times.size > 0:
-    print(f"Avg frame time: {stats['avg_ms']:.2f} ms  (min {stats['min_ms']:.2f}, max {stats['max_ms']:.2f})")
-
-for w in warns:
-    print(w)
-
-x = np.arange(1, len(frame_times) + 1)
-
-fig, ax = plt.subplots()
-line, = ax.plot(x, frame_times, marker='o', linestyle='-')
-ax.set_xlabel('Frame #')
-ax.set_ylabel('Frame Time (ms)')
-ax.set_title('Frame Time per Frame')
-ax.grid(True)
-line.set_picker(5)
-
-annot = ax.annotate(
-    "",                            # no text yet
-    xy=(0,0),                      # will be updated when clicked
-    xytext=(15,15),                # offset the text
-    textcoords="offset points",
-    bbox=dict(boxstyle="round", fc="w"),
-    arrowprops=dict(arrowstyle="->")
-)
-annot.set_visible(False)
-runs_text = fig.text(0.1, -0.15, "", wrap=True, fontsize=10, ha='left', va='top', transform=ax.transAxes)
-
-def show_runs_in_popup(ind):
-    runs = frame_runs[ind]
-    frame_time = frame_times[ind]
-    root = tk.Tk()
-    root.title("Frame Details")
-    root.geometry("800x600")
-    text = ScrolledText(root, wrap=tk.WORD, font=("Consolas", 10))
-    text.pack(expand=True, fill='both')
-    
-    frame_start = runs[0]["start_t"]
-    frame_end = runs[-1]["end_t"]
-    frame_duration = frame_end - frame_start
-    
-    # TODO: the self time and real time diff can be huge, consider when main thread is 
-    # waitforpresent while gfxthread is compiling shader
-    text.insert(tk.END, f"Self time: {frame_duration:.2f} ms, real time {frame_time:.2f} ms \n")
-    text.insert(tk.END, f"Frame Start: {frame_start:.2f} ms, End: {frame_end:.2f} ms\n")
-    text.insert(tk.END, "-" * 10 + "\n\n")
-    
-    for i, r in enumerate(runs):
-        phase_duration = r['end_t'] - r['start_t'] + 1
-        text.insert(tk.END, f"Phase {i+1}: {r['phase']}\t")
-        text.insert(tk.END, f"  Duration: {phase_duration:.2f} ms ({r['start_t']:.2f} - {r['end_t']:.2f})\t")
-        text.insert(tk.END, f"  Samples: {len(r['stacks'])}\n")
-        
-        if r['stacks'] and len(r['stacks']) > 0:
-            shown_stacks = set()
-            for stack in r['stacks']:
-                if stack and len(stack) > 0:
-                    # Show top 5 frames of the stack
-                    stack_preview = " -> ".join(stack[:5])
-                    if len(stack) > 5:
-                        stack_preview += f" ... (+{len(stack)-5} more)"
-                    
-                    text.insert(tk.END, f"    {stack_preview}\n")
-        
-        text.insert(tk.END, "\n")
-    
-    text.config(state=tk.DISABLED)
-    root.mainloop()
-
-def on_pick(event):
-    ind = event.ind[0]
-    xdata, ydata = line.get_data()
-    x0, y0 = xdata[ind], ydata[ind]
-    annot.xy = (x0, y0)
-    annot.set_text(f"Frame {int(x0)}: {y0:.2f} ms")
-    annot.set_visible(True)
-    show_runs_in_popup(ind)
-    fig.canvas.draw()
-
-fig.canvas.mpl_connect('pick_event', on_pick)
-plt.subplots_adjust(bottom=0.3)  # Make space for the text box
-plt.show()
+
+
+def compact_result(result, source):
+    """
+    An analyze_thread result without its store and Run objects, cheap to send back
+    from a worker process, see expand_result.
+
+    source: (path, selectors, use_cache, content_hash, global_min_time) the store was
+    loaded with, so result_store can load it again.
+    """
+    runs = result["runs"]
+    run_start = np.array([r.start_i for r in runs], dtype=np.int32)
+    compact = {key: result[key] for key in ("name", "tid", "merges", "frame_times", "warnings", "phase_matrix", "stats", "hot")}
+    compact.update({
+        "source": source,
+        "run_phase": np.array([PHASE_NAMES.index(r.phase) for r in runs], dtype=np.int8),
+        "run_start": run_start,
+        "run_end": np.array([r.end_i for r in runs], dtype=np.int32),
+        "run_start_t": np.array([r.start_t for r in runs], dtype=np.float64),
+        "run_end_t": np.array([r.end_t for r in runs], dtype=np.float64),
+        "frame_first_run": np.searchsorted(run_start, [frame[0].start_i for frame in result["frame_runs"]]).astype(np.int32),
+        "frame_run_count": np.array([len(frame) for frame in result["frame_runs"]], dtype=np.int32),
+    })
+    return compact
+
+
+def expand_result(compact):
+    """Rebuilds the runs and frame_runs of a compact_result, its store is loaded by result_store."""
+    runs = [
+        Run(PHASE_NAMES[phase], start_i, end_i, start_t, end_t)
+        for phase, start_i, end_i, start_t, end_t in zip(
+            compact["run_phase"].tolist(), compact["run_start"].tolist(), compact["run_end"].tolist(),
+            compact["run_start_t"].tolist(), compact["run_end_t"].tolist())
+    ]
+    result = {key: compact[key] for key in ("name", "tid", "merges", "frame_times", "warnings", "phase_matrix", "stats", "hot", "source")}
+    result["store"] = None
+    result["runs"] = runs
+    result["frame_runs"] = [runs[first:first + count] for first, count in
+                            zip(compact["frame_first_run"].tolist(), compact["frame_run_count"].tolist())]
+    return result
+
+
+def result_store(result):
+    """The sample store of an analyze_profile result, loaded again (normally from the analysis cache) when it was analyzed in a worker."""
+    if result["store"] is None:
+        path, selectors, use_cache, content_hash, global_min_time = result["source"]
+        for store in load_thread_stores(path, set(selectors), use_cache, content_hash, global_min_time):
+            if store["name"] == result["name"] and store["tid"] == result["tid"]:
+                result["store"] = store
+                break
+        else:
+            raise ValueError(f"Thread {result['name']} (TID: {result['tid']}) not found in {path}")
+    return result["store"]
+
+
+def _analyze_threads_worker(source, rules, top_n):
+    # spawned workers start with the built-in rules
+    set_phase_rules(rules["priority"], rules["patterns"], rules["frame_order"], rules["gap_merge"])
+    path, selectors, use_cache, content_hash, global_min_time = source
+    return [compact_result(analyze_thread(store, top_n), source)
+            for store in load_thread_stores(path, set(selectors), use_cache, content_hash, global_min_time)]
+
+
+def analyze_profile(path, threads=DEFAULT_THREADS, use_cache=True, max_workers=None, top_n=0):
+    """
+    Analyzes the selected threads of a profile, the other threads are never resolved.
+
+    threads: names or tids (as strings) of the threads to analyze.
+    top_n: number of hot functions per frame to find, 0 for none.
+
+    A single selector is analyzed in-process. Several selectors are analyzed in a
+    process pool, one worker per distinct thread: the profile's threads are listed
+    once (see scan_threads), selectors naming a thread that is already taken are
+    dropped, and each worker only decodes its own thread. Workers send back
+    compact results, their store is only loaded again by result_store.
+    Returns the analyze_thread results, in selector order.
+    """
+    threads = list(dict.fromkeys(threads))
+    if len(threads) <= 1:
+        return [analyze_thread(store, top_n) for store in load_thread_stores(path, set(threads), use_cache)]
+
+    listed = remembered(path, "threads", scan_threads) if use_cache else scan_threads(path)
+    min_times = [thread["min_time"] for thread in listed if thread["min_time"] is not None]
+    global_min_time = min(min_times) if min_times else 0
+    content_hash = profile_hash(path) if use_cache else None
+    sources = []
+    taken = set()
+    for selector in threads:
+        matched = {i for i, thread in enumerate(listed) if thread_matches(thread, {selector})}
+        if matched - taken:
+            taken |= matched
+            sources.append((path, (selector,), use_cache, content_hash, global_min_time))
+
+    results = []
+    seen = set()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_analyze_threads_worker, source, phase_rules(), top_n) for source in sources]
+        for future in futures:
+            for compact in future.result():
+                # a selector may also match a thread another selector took
+                if (compact["name"], compact["tid"]) not in seen:
+                    seen.add((compact["name"], compact["tid"]))
+                    results.append(expand_result(compact))
+    return results
+
+
+def print_frame_stats(result):
+    frame_runs = result["frame_runs"]
+    frame_times = result["frame_times"]
+    stats = result["stats"].summary()
+    print(f"Thread: {result['name']} (TID: {result['tid']})")
+    print(f"Merged {len(result['merges']['gap_ms'])} gap runs")
+    print(f"Detected frames: {len(frame_runs)}")
+    if frame_times.size > 0:
+        print(f"Avg frame time: {stats['avg_ms']:.2f} ms  (min {stats['min_ms']:.2f}, max {stats['max_ms']:.2f})")
+        print("Percentiles: " + ", ".join(f"P{q * 100:g} {stats[f'p{q * 100:g}_ms']:.2f} ms" for q in STATS_QUANTILES))
+        print("Jank: " + ", ".join(f"{count} frames {budget}" for budget, count in stats["jank"].items()))
+        for phase, phase_stats in stats["phases"].items():
+            print(f"  {phase}: avg {phase_stats['avg_ms']:.2f} ms, "
+                  + ", ".join(f"P{q * 100:g} {phase_stats[f'p{q * 100:g}_ms']:.2f}" for q in STATS_QUANTILES))
+
+    for w in result["warnings"]:
+        print(w)
+
+
+def print_slowest_frames(result, n=5):
+    order = slowest_frames(result, n)
+    if len(order) == 0:
+        return
+    if result["hot"] is not None:
+        hot_self = [result["hot"]["self"][i] for i in order.tolist()]
+    else:
+        hot_self = frame_hot_functions(result_store(result), [result["frame_runs"][i] for i in order], top_n=1)["self"]
+    print("Slowest frames:")
+    for k, i in enumerate(order.tolist()):
+        phases = result["phase_matrix"][i]
+        top = hot_self[k][0][0] if hot_self[k] else "-"
+        print(f"  Frame {i + 1}: {result['frame_times'][i]:.2f} ms, mostly {PHASE_NAMES[int(np.argmax(phases))]} "
+              f"({phases.max():.2f} ms), top self function {top}")
+
+
+def frame_records(result, hot=None):
+    """
+    One record per frame, with the ms spent per phase and, when hot holds the output
+    of frame_hot_functions, the frame's top functions.
+    """
+    records = []
+    for i, (runs, frame_time) in enumerate(zip(result["frame_runs"], result["frame_times"])):
+        record = {
+            "frame": i + 1,
+            "start_ms": runs[0].start_t,
+            "end_ms": runs[-1].end_t,
+            "frame_ms": float(frame_time),
+            "runs": len(runs),
+            "samples": runs[-1].end_i - runs[0].start_i + 1,
+        }
+        for phase, ms in zip(PHASE_NAMES, result["phase_matrix"][i].tolist()):
+            record[f"{phase}_ms"] = round(ms, 2)
+        if hot is not None:
+            record["hot_self"] = hot["self"][i]
+            record["hot_inclusive"] = hot["inclusive"][i]
+        records.append(record)
+    return records
+
+
+def run_records(result):
+    return [
+        {"phase": r.phase, "start_i": r.start_i, "end_i": r.end_i, "start_ms": r.start_t, "end_ms": r.end_t, "samples": len(r)}
+        for r in result["runs"]
+    ]
+
+
+def thread_summary(result, top_n=0):
+    """
+    Plain data summary of an analyze_thread result, ready for json.dump.
+
+    top_n: number of hot functions listed per frame, 0 for none. The result's own hot
+    functions are used when analyze_profile found them.
+    """
+    hot = None
+    if top_n > 0:
+        hot = result["hot"] or frame_hot_functions(result_store(result), result["frame_runs"], top_n)
+    return {
+        "name": result["name"],
+        "tid": result["tid"],
+        "stats": result["stats"].summary(),
+        "sketch": result["stats"].to_dict(),
+        "merged_gaps": len(result["merges"]["gap_ms"]),
+        "warnings": result["warnings"],
+        "frames": frame_records(result, hot),
+        "runs": run_records(result),
+    }
+
+
+def _write_csv(path, records, fieldnames):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def write_results(results, out_dir, name, fmt="json", top_n=5):
+    """
+    Writes frame metrics, runs and warnings of analyze_profile results.
+
+    json: one <name>.frames.json holding every thread, with top_n hot functions per frame.
+    csv: <name>.<thread>.frames.csv, .runs.csv and .warnings.csv per thread.
+    Returns the written paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    summaries = [thread_summary(result, top_n if fmt == "json" else 0) for result in results]
+    if fmt == "json":
+        path = os.path.join(out_dir, f"{name}.frames.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"threads": summaries}, f)
+        return [path]
+
+    paths = []
+    for summary in summaries:
+        thread = re.sub(r"[^\w.-]+", "_", f"{summary['name']}_{summary['tid']}")
+        prefix = os.path.join(out_dir, f"{name}.{thread}")
+        _write_csv(prefix + ".frames.csv", summary["frames"],
+                   ["frame", "start_ms", "end_ms", "frame_ms", "runs", "samples"] + [f"{phase}_ms" for phase in PHASE_NAMES])
+        _write_csv(prefix + ".runs.csv", summary["runs"], ["phase", "start_i", "end_i", "start_ms", "end_ms", "samples"])
+        _write_csv(prefix + ".warnings.csv", [{"warning": w} for w in summary["warnings"]], ["warning"])
+        paths += [prefix + ".frames.csv", prefix + ".runs.csv", prefix + ".warnings.csv"]
+    return paths
+
+
+# Profiles written by Capture.py's post processing, Results/apks_*/result_*/
+CAPTURE_PROFILE_NAMES = ("gecko-profile-translated.json", "gecko-profile-translated.json.gz")
+
+
+def capture_timestamp(profile_path):
+    # result_<timestamp> folders are named by Capture.py, fall back to the file time
+    folder = os.path.basename(os.path.dirname(os.path.abspath(profile_path)))
+    try:
+        return datetime.datetime.strptime(folder[len("result_"):], "%Y%m%d_%H_%M_%S")
+    except ValueError:
+        return datetime.datetime.fromtimestamp(os.path.getmtime(profile_path))
+
+
+def find_captures(results_dir):
+    """Returns the (timestamp, profile path) of every capture under a Results folder, oldest first."""
+    captures = []
+    for root, _, files in os.walk(results_dir):
+        for name in files:
+            if name in CAPTURE_PROFILE_NAMES:
+                path = os.path.join(root, name)
+                captures.append((capture_timestamp(path), path))
+    return sorted(captures)
+
+
+def _analyze_capture_worker(path, threads, use_cache, rules):
+    set_phase_rules(rules["priority"], rules["patterns"], rules["frame_order"], rules["gap_merge"])
+    threads_summary = []
+    # one pass over the profile for all threads of the capture
+    for store in load_thread_stores(path, set(threads), use_cache):
+        result = analyze_thread(store)
+        threads_summary.append({
+            "name": store["name"],
+            "tid": store["tid"],
+            "stats": result["stats"].summary(),
+            "sketch": result["stats"].to_dict(),
+        })
+    return threads_summary
+
+
+# Worker processes of batch_analyze by default, each one holds a whole profile's threads
+BATCH_MAX_WORKERS = 4
+
+def batch_analyze(results_dir, threads=DEFAULT_THREADS, use_cache=True, max_workers=None):
+    """
+    Analyzes every capture under a Results folder in a process pool.
+
+    max_workers: number of worker processes, defaults to BATCH_MAX_WORKERS or the
+    core count if lower.
+
+    Returns one dict per capture, oldest first, with its "timestamp", "profile" and
+    either the summary of each analyzed thread in "threads" or an "error".
+    """
+    captures = find_captures(results_dir)
+    records = []
+    if max_workers is None:
+        max_workers = min(BATCH_MAX_WORKERS, os.cpu_count() or 1)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_analyze_capture_worker, path, list(threads), use_cache, phase_rules())
+                   for _, path in captures]
+        for (timestamp, path), future in zip(captures, futures):
+            record = {"timestamp": timestamp.isoformat(sep=" "), "profile": os.path.relpath(path, results_dir)}
+            try:
+                record["threads"] = future.result()
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+                print(f"Failed to analyze {path}: {record['error']}")
+            records.append(record)
+    return records
+
+
+def batch_report_rows(records):
+    """
+    Flattens batch_analyze records into one comparison row per capture and thread.
+
+    The avg and P95 changes are relative to the previous capture of the same thread,
+    a final "ALL" row per thread merges the stats of every capture.
+    """
+    rows = []
+    previous = {}
+    combined = {}
+    for record in records:
+        for thread in record.get("threads", []):
+            stats = thread["stats"]
+            row = {"timestamp": record["timestamp"], "capture": os.path.dirname(record["profile"]), "thread": thread["name"],
+                   "frames": stats.get("frames", 0)}
+            row.update(_report_stats_columns(stats))
+            last = previous.get(thread["name"])
+            for key in ("avg_ms", "p95_ms"):
+                change = None
+                if last and last.get(key) and stats.get(key) is not None:
+                    change = (stats[key] - last[key]) / last[key] * 100
+                row[f"{key[:-3]}_change_%"] = change
+            previous[thread["name"]] = stats
+            rows.append(row)
+            combined.setdefault(thread["name"], FrameTimeStats()).merge(FrameTimeStats.from_dict(thread["sketch"]))
+
+    for name, stats in combined.items():
+        summary = stats.summary()
+        row = {"timestamp": "", "capture": "ALL", "thread": name, "frames": summary.get("frames", 0)}
+        row.update(_report_stats_columns(summary))
+        rows.append(row)
+    return rows
+
+
+def _report_stats_columns(stats):
+    columns = {key: stats.get(key) for key in ["avg_ms", "min_ms"] + [f"p{q * 100:g}_ms" for q in STATS_QUANTILES] + ["max_ms"]}
+    for budget, count in stats.get("jank", {}).items():
+        columns[f"jank{budget}"] = count
+    for phase, phase_stats in stats.get("phases", {}).items():
+        columns[f"{phase}_avg_ms"] = phase_stats["avg_ms"]
+    return columns
+
+
+def print_report(rows):
+    if not rows:
+        print("No capture found.")
+        return
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    cells = [[_format_cell(row.get(key)) for key in columns] for row in rows]
+    widths = [max(len(key), *(len(r[i]) for r in cells)) for i, key in enumerate(columns)]
+    print("  ".join(key.ljust(w) for key, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(cell.ljust(w) for cell, w in zip(r, widths)))
+
+
+def _format_cell(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def write_report(records, rows, out_dir, fmt="csv"):
+    os.makedirs(out_dir, exist_ok=True)
+    if fmt == "json":
+        path = os.path.join(out_dir, "batch_report.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"captures": records, "rows": rows}, f)
+        return path
+    path = os.path.join(out_dir, "batch_report.csv")
+    _write_csv(path, rows, list(dict.fromkeys(key for row in rows for key in row)))
+    return path
+
+
+def decimate_min_max(x, y, start, end, bins):
+    """
+    Reduces x[start:end], y[start:end] to the min and max point of each of bins buckets.
+
+    Spikes survive at any zoom level while only about 2 * bins points are drawn;
+    ranges that already fit are returned as they are.
+    """
+    x, y = x[start:end], y[start:end]
+    if len(y) <= 2 * bins:
+        return x, y
+    size = -(-len(y) // bins)
+    rows = -(-len(y) // size)
+    padded_low = np.full(rows * size, np.inf)
+    padded_low[:len(y)] = y
+    padded_high = np.full(rows * size, -np.inf)
+    padded_high[:len(y)] = y
+    offsets = np.arange(rows) * size
+    keep = np.unique(np.concatenate((
+        padded_low.reshape(rows, size).argmin(axis=1) + offsets,
+        padded_high.reshape(rows, size).argmax(axis=1) + offsets,
+    )))
+    return x[keep], y[keep]
+
+
+def show_frame_times(result):
+    # GUI modules are only needed by the interactive viewer
+    import matplotlib
+    # the detail window shares the plot's Tk event loop
+    matplotlib.use("TkAgg")
+    import matplotlib.pyplot as plt
+    import tkinter as tk
+    from tkinter import ttk
+
+    store = result_store(result)
+    frame_runs = result["frame_runs"]
+    frame_times = np.asarray(result["frame_times"], dtype=float)
+    x = np.arange(1, len(frame_times) + 1)
+
+    fig, ax = plt.subplots()
+    # only a min/max decimated copy of the visible frames is drawn, see update_line
+    line, = ax.plot([], [], marker='o', linestyle='-')
+    ax.set_xlabel('Frame #')
+    ax.set_ylabel('Frame Time (ms)')
+    ax.set_title(f"Frame Time per Frame ({store['name']})")
+    ax.grid(True)
+    if len(frame_times):
+        pad = max(len(frame_times) * 0.02, 1)
+        ax.set_xlim(1 - pad, len(frame_times) + pad)
+        ax.set_ylim(0, frame_times.max() * 1.05 + 1)
+
+    # the annotation and selection are animated and blitted over the cached plot
+    annot = ax.annotate(
+        "",                            # no text yet
+        xy=(0,0),                      # will be updated when clicked
+        xytext=(15,15),                # offset the text
+        textcoords="offset points",
+        bbox=dict(boxstyle="round", fc="w"),
+        arrowprops=dict(arrowstyle="->"),
+        animated=True,
+    )
+    annot.set_visible(False)
+    selected, = ax.plot([], [], marker='o', markersize=10, markerfacecolor='none', color='r', animated=True)
+    runs_text = fig.text(0.1, -0.15, "", wrap=True, fontsize=10, ha='left', va='top', transform=ax.transAxes)
+    blit = {"background": None}
+
+    def update_line(ax=ax):
+        x0, x1 = ax.get_xlim()
+        start = max(int(np.searchsorted(x, x0, side="left")) - 1, 0)
+        end = min(int(np.searchsorted(x, x1, side="right")) + 1, len(x))
+        bins = max(int(ax.bbox.width), 1)
+        line_x, line_y = decimate_min_max(x, frame_times, start, end, bins)
+        line.set_data(line_x, line_y)
+        # markers only help once single frames can be told apart
+        line.set_marker('o' if end - start <= bins // 4 else '')
+
+    def draw_animated():
+        if blit["background"] is None:
+            return
+        fig.canvas.restore_region(blit["background"])
+        ax.draw_artist(selected)
+        ax.draw_artist(annot)
+        fig.canvas.blit(fig.bbox)
+
+    def on_draw(event):
+        blit["background"] = fig.canvas.copy_from_bbox(fig.bbox)
+        ax.draw_artist(selected)
+        ax.draw_artist(annot)
+
+    def pick_frame(event, tolerance=5):
+        """Index of the frame closest to a click, looked up from the frame numbers in x."""
+        if not len(x):
+            return None
+        to_data = ax.transData.inverted()
+        left = to_data.transform((event.x - tolerance, event.y))[0]
+        right = to_data.transform((event.x + tolerance, event.y))[0]
+        start = int(np.searchsorted(x, left, side="left"))
+        end = int(np.searchsorted(x, right, side="right"))
+        if start >= end:
+            return None
+        points = ax.transData.transform(np.column_stack((x[start:end], frame_times[start:end])))
+        distance = np.hypot(points[:, 0] - event.x, points[:, 1] - event.y)
+        best = int(np.argmin(distance))
+        # zoomed out, several frames share a pixel column: any of them within reach of the click
+        return start + best if distance[best] <= tolerance * 2 else None
+
+    detail = {}
+
+    def detail_window():
+        # a single window for all frames, hidden instead of destroyed when closed
+        if detail:
+            detail["window"].deiconify()
+            detail["window"].lift()
+            return detail
+        window = tk.Toplevel(fig.canvas.get_tk_widget().winfo_toplevel())
+        window.title("Frame Details")
+        window.geometry("900x600")
+        window.protocol("WM_DELETE_WINDOW", window.withdraw)
+        header = tk.Label(window, justify=tk.LEFT, anchor="w", font=("Consolas", 10))
+        header.pack(fill="x")
+        full = tk.BooleanVar(window, value=False)
+        tk.Checkbutton(window, text="Full signatures", variable=full,
+                       command=lambda: show_runs_in_popup(detail["ind"])).pack(anchor="w")
+        tree = ttk.Treeview(window, columns=("samples",))
+        tree.heading("#0", text="Run / stack", anchor="w")
+        tree.heading("samples", text="Samples", anchor="e")
+        tree.column("samples", width=120, anchor="e", stretch=False)
+        scroll = ttk.Scrollbar(window, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side="right", fill="y")
+        tree.pack(expand=True, fill="both")
+        tree.bind("<<TreeviewOpen>>", on_tree_open)
+        detail.update(window=window, header=header, full=full, tree=tree, children={})
+        return detail
+
+    def add_lazy_item(parent, text, samples, children):
+        # children are only inserted when the item is opened
+        tree = detail["tree"]
+        item = tree.insert(parent, tk.END, text=text, values=(samples,))
+        if children is not None:
+            tree.insert(item, tk.END, text="...")
+            detail["children"][item] = children
+        return item
+
+    def on_tree_open(event):
+        tree = detail["tree"]
+        item = tree.focus()
+        children = detail["children"].pop(item, None)
+        if children is None:
+            return
+        tree.delete(*tree.get_children(item))
+        kind, value = children
+        if kind == "run":
+            total = len(value)
+            for stack_index, count in value.stack_counts(store):
+                stack = node_stack(store, stack_index, detail["full"].get())
+                if stack_index < 0 or not stack:
+                    add_lazy_item(item, str(stack) if stack_index < 0 else "<empty stack>", count, None)
+                    continue
+                # Show top 5 frames of the stack
+                stack_preview = " -> ".join(stack[:5])
+                if len(stack) > 5:
+                    stack_preview += f" ... (+{len(stack)-5} more)"
+                add_lazy_item(item, stack_preview, f"{count} ({100 * count / total:.0f}%)", ("stack", stack))
+        else:
+            for frame in value:
+                tree.insert(item, tk.END, text=frame)
+
+    def show_runs_in_popup(ind):
+        runs = frame_runs[ind]
+        frame_time = frame_times[ind]
+        detail_window()
+        detail["ind"] = ind
+        tree = detail["tree"]
+        tree.delete(*tree.get_children())
+        detail["children"].clear()
+
+        frame_start = runs[0].start_t
+        frame_end = runs[-1].end_t
+        frame_duration = frame_end - frame_start
+
+        # TODO: the self time and real time diff can be huge, consider when main thread is 
+        # waitforpresent while gfxthread is compiling shader
+        detail["header"].config(text=f"Frame {ind + 1}\n"
+                                     f"Self time: {frame_duration:.2f} ms, real time {frame_time:.2f} ms\n"
+                                     f"Frame Start: {frame_start:.2f} ms, End: {frame_end:.2f} ms")
+        for i, r in enumerate(runs):
+            phase_duration = r.end_t - r.start_t + 1
+            add_lazy_item("", f"Phase {i+1}: {r.phase}   Duration: {phase_duration:.2f} ms ({r.start_t:.2f} - {r.end_t:.2f})",
+                          len(r), ("run", r))
+        tree.yview_moveto(0)
+
+    def on_click(event):
+        # leave zoom and pan clicks to the toolbar
+        toolbar = getattr(fig.canvas, "toolbar", None)
+        if event.inaxes is not ax or event.button != 1 or (toolbar is not None and toolbar.mode):
+            return
+        ind = pick_frame(event)
+        if ind is None:
+            return
+        x0, y0 = x[ind], frame_times[ind]
+        annot.xy = (x0, y0)
+        annot.set_text(f"Frame {int(x0)}: {y0:.2f} ms")
+        annot.set_visible(True)
+        selected.set_data([x0], [y0])
+        draw_animated()
+        show_runs_in_popup(ind)
+
+    update_line()
+    ax.callbacks.connect('xlim_changed', update_line)
+    fig.canvas.mpl_connect('resize_event', lambda event: update_line())
+    fig.canvas.mpl_connect('draw_event', on_draw)
+    fig.canvas.mpl_connect('button_press_event', on_click)
+    plt.subplots_adjust(bottom=0.3)  # Make space for the text box
+    plt.show()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # "resolve_stack.py gecko-profile.json" keeps opening the viewer
+    if argv and argv[0] not in ("view", "analyze", "batch", "-h", "--help"):
+        argv = ["view"] + argv
+
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--rules", help="JSON file with phase rules, see load_phase_rules")
+    options.add_argument("--no-cache", action="store_true", help="don't read or write the analysis cache")
+    common = argparse.ArgumentParser(add_help=False, parents=[options])
+    common.add_argument("profile", help="gecko-profile.json or gecko-profile-translated.json, optionally gzipped")
+    common.add_argument("threads", nargs="*", default=DEFAULT_THREADS, help="names or tids of the threads to analyze")
+
+    parser = argparse.ArgumentParser(description="Divide the samples of a gecko profile into frames.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("view", parents=[common], help="plot the frame times of the first thread")
+    analyze_parser = subparsers.add_parser("analyze", parents=[common], help="write frame metrics, runs and warnings, no GUI")
+    analyze_parser.add_argument("-o", "--out", help="output folder, defaults to the profile's folder")
+    analyze_parser.add_argument("--format", choices=("json", "csv"), default="json")
+    analyze_parser.add_argument("--top", type=int, default=5, help="hot functions listed per frame in json output")
+    batch_parser = subparsers.add_parser("batch", parents=[options], help="compare every capture under a Results folder")
+    batch_parser.add_argument("results_dir", help="Results folder created by Capture.py")
+    batch_parser.add_argument("threads", nargs="*", default=DEFAULT_THREADS, help="names or tids of the threads to analyze")
+    batch_parser.add_argument("-o", "--out", help="output folder, defaults to results_dir")
+    batch_parser.add_argument("--format", choices=("json", "csv"), default="csv")
+    batch_parser.add_argument("--workers", type=int, help=f"number of worker processes, defaults to {BATCH_MAX_WORKERS} or the core count if lower")
+    args = parser.parse_args(argv)
+
+    if args.rules:
+        load_phase_rules(args.rules)
+    if args.command == "batch":
+        records = batch_analyze(args.results_dir, args.threads, use_cache=not args.no_cache, max_workers=args.workers)
+        rows = batch_report_rows(records)
+        print_report(rows)
+        print(f"Wrote {write_report(records, rows, args.out or args.results_dir, args.format)}")
+        return 0
+
+    threads = args.threads
+    # analyze lists the top function of the slowest frames even without --top
+    top_n = max(args.top, 1) if args.command == "analyze" else 0
+    results = analyze_profile(args.profile, threads, use_cache=not args.no_cache, top_n=top_n)
+    if not results:
+        print(f"No thread matching {threads} found.")
+        return 1
+
+    if args.command == "analyze":
+        for result in results:
+            print_frame_stats(result)
+            print_slowest_frames(result)
+        out_dir = args.out or os.path.dirname(os.path.abspath(args.profile))
+        for path in write_results(results, out_dir, os.path.basename(args.profile), args.format, args.top):
+            print(f"Wrote {path}")
+        return 0
+
+    for r in results[0]["runs"]:
+        print(r)
+    for result in results:
+        print_frame_stats(result)
+
+    show_frame_times(results[0])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())